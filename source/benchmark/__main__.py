@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+
+import ujson
+
+from benchmark.synthetic import generate_pubmed_xml
+from benchmark.bench_parser import run_benchmarks, write_results
+from benchmark.bench_memory import check_memory
+from script.xml_input import READERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='パーサーのスループット計測')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    gen = subparsers.add_parser('generate', help='合成PubmedArticleSetを作成')
+    gen.add_argument('path')
+    gen.add_argument('-n', '--articles', type=int, default=10000)
+    gen.add_argument('--seed', type=int, default=0)
+    gen.add_argument('--authors', type=int, nargs=2, metavar=('MIN', 'MAX'))
+    gen.add_argument('--references', type=int, nargs=2, metavar=('MIN', 'MAX'))
+    gen.add_argument('--structured-abstract-ratio', type=float)
+    gen.add_argument('--delete-ratio', type=float)
+
+    run = subparsers.add_parser('run', help='各ステージの時間を計測')
+    run.add_argument('path', nargs='?', default='benchmark/data/synthetic.xml.gz')
+    run.add_argument('-n', '--articles', type=int, default=10000,
+                     help='pathが存在しない場合に作成する記事数')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--mongo-uri', help='指定するとMongoSinkの書き込みも計測する')
+    run.add_argument('--readers', nargs='+', default=['gzip'], choices=READERS,
+                     help='iterparseを計測する.gzの読み方')
+    run.add_argument('-o', '--output', help='結果を追記するJSON Linesファイル')
+
+    mem = subparsers.add_parser('memory', help='パース中のRSSが増え続けないかを確認')
+    mem.add_argument('path', nargs='?', default='benchmark/data/memory.xml.gz')
+    mem.add_argument('-n', '--articles', type=int, default=200000,
+                     help='pathが存在しない場合に作成する記事数')
+    mem.add_argument('--sample-interval', type=int, default=5000)
+    mem.add_argument('--max-growth-mb', type=float, default=20)
+    mem.add_argument('--reader', default='gzip', choices=READERS)
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        shape = {key: getattr(args, key) for key in
+                 ('authors', 'references', 'structured_abstract_ratio', 'delete_ratio')
+                 if getattr(args, key) is not None}
+        shape = {key: tuple(value) if isinstance(value, list) else value for key, value in shape.items()}
+        generate_pubmed_xml(args.path, args.articles, seed=args.seed, **shape)
+    else:
+        if not os.path.exists(args.path):
+            os.makedirs(os.path.dirname(args.path) or '.', exist_ok=True)
+            generate_pubmed_xml(args.path, args.articles)
+        if args.command == 'memory':
+            result = check_memory(args.path, sample_interval=args.sample_interval,
+                                  max_growth_mb=args.max_growth_mb, reader=args.reader)
+            print(ujson.dumps(result))
+            # メモリが増え続けていれば失敗として終了する（CIなどでの回帰チェック用）
+            sys.exit(0 if result['flat'] else 1)
+        write_results(run_benchmarks(args.path, repeat=args.repeat, mongo_uri=args.mongo_uri,
+                                     readers=args.readers), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from script.metrics import current_rss_bytes
+from script.pubmed_iter_parser import parse_file
+from script.sink import BaseSink
+
+
+class _RssSamplingSink(BaseSink):
+    """書き込まずに捨て，sample_interval件ごとにRSS（MB）を記録するSink"""
+
+    def __init__(self, sample_interval):
+        super().__init__()
+        self.sample_interval = sample_interval
+        self.articles = 0
+        self.samples = []
+
+    def write(self, doc):
+        self.articles += 1
+        if self.articles % self.sample_interval == 0:
+            self.samples.append(current_rss_bytes() / 2 ** 20)
+
+    def delete(self, pmid, base_xml):
+        pass
+
+
+def check_memory(xml_path, sample_interval=5000, max_growth_mb=20, reader='gzip'):
+    """ファイルをパースしながらRSSを記録し，メモリが増え続けていないかを確認する
+
+    最初のサンプルはlxmlやスキーマの初期化の分を含むので，2番目のサンプルからの増加量で判定する．
+
+    Args:
+        xml_path(str): パースするファイル（大きめの合成ファイルなど）
+        sample_interval(int): RSSを記録する間隔（記事数）
+        max_growth_mb(float): 許容するRSSの増加量（MB）
+        reader(str): .gzの読み方（xml_input.open_xmlを参照）
+
+    Returns:
+        result(dict): サンプルしたRSS（MB），増加量，判定
+    """
+    sink = _RssSamplingSink(sample_interval)
+    parse_file(xml_path, sink, reader=reader)
+    samples = sink.samples
+    baseline = samples[1] if len(samples) > 1 else (samples[0] if samples else 0.0)
+    growth = max(samples) - baseline if samples else 0.0
+    return {
+        'file': xml_path,
+        'articles': sink.articles,
+        'rss_mb': [round(rss, 1) for rss in samples],
+        'growth_mb': round(growth, 1),
+        'flat': growth <= max_growth_mb,
+    }
@@ -0,0 +1,153 @@
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import bson
+import ujson
+from lxml import etree
+
+from script.utils import fast_iter
+from script.xml_input import open_xml
+from script.pubmed_iter_parser import parse_entity, parse_record
+from script.medline_parser import parse_article_info
+from script.sink import MongoSink
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class _Timer:
+    """コールバック内で計測した時間と件数を積算する"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+
+    def call(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        ret = func(*args, **kwargs)
+        self.seconds += time.perf_counter() - start
+        self.count += 1
+        return ret
+
+
+def _iterparse(xml_path, func, reader='gzip'):
+    with open_xml(xml_path, reader) as f:
+        tree = etree.iterparse(f, events=('end',), tag='PubmedArticle')
+        fast_iter(tree, func)
+
+
+def bench_iterparse(xml_path, reader='gzip'):
+    """展開とXMLのパースのみ（フィールド抽出なし）の時間"""
+    timer = _Timer()
+    start = time.perf_counter()
+    _iterparse(xml_path, lambda elem: timer.call(lambda: None), reader)
+    return {'seconds': time.perf_counter() - start, 'articles': timer.count}
+
+
+def bench_parse_entity(xml_path, serialize=True):
+    """parse_entity（dict）とparse_record（__slots__のレコード）の時間と，その出力のシリアライズの時間"""
+    timers = {'parse_entity': _Timer(), 'parse_record': _Timer(), 'serialize_json': _Timer(),
+              'serialize_bson': _Timer()}
+
+    def func(elem):
+        timers['parse_record'].call(parse_record, elem, xml_path)
+        doc = timers['parse_entity'].call(parse_entity, elem, xml_path)
+        if serialize:
+            timers['serialize_json'].call(ujson.dumps, doc, ensure_ascii=False)
+            timers['serialize_bson'].call(bson.encode, doc)
+
+    _iterparse(xml_path, func)
+    return {stage: {'seconds': timer.seconds, 'articles': timer.count}
+            for stage, timer in timers.items() if timer.count}
+
+
+def bench_parse_article_info(xml_path, year_info_only=True, nlm_category=False, author_list=False):
+    """medline_parser.parse_article_infoの時間"""
+    timer = _Timer()
+    _iterparse(xml_path, lambda elem: timer.call(parse_article_info, elem.find('MedlineCitation'),
+                                                 year_info_only, nlm_category, author_list))
+    return {'seconds': timer.seconds, 'articles': timer.count}
+
+
+def bench_mongo_sink(xml_path, mongo_uri, batch_size=1000, ordered=False):
+    """MongoSinkへの書き込み時間．計測用のコレクションは毎回作り直す"""
+    from pymongo import MongoClient
+
+    collection = MongoClient(mongo_uri).pubmed_benchmark.pubmed_article
+    collection.drop()
+    sink = MongoSink(collection, batch_size=batch_size, ordered=ordered)
+    timer = _Timer()
+    _iterparse(xml_path, lambda elem: timer.call(sink.write, parse_entity(elem, xml_path)))
+    timer.call(sink.close)
+    timer.count -= 1
+    return {'seconds': timer.seconds, 'articles': timer.count}
+
+
+def run_benchmarks(xml_path, repeat=3, mongo_uri=None, readers=('gzip',)):
+    """各ステージをrepeat回計測し，最速の結果を返す
+
+    Args:
+        xml_path(str): 計測に使うPubmedArticleSetのファイル
+        repeat(int): 計測回数
+        mongo_uri(str): 指定した場合はMongoSinkの書き込みも計測する
+        readers(tuple): iterparseを計測する.gzの読み方（xml_input.open_xmlを参照）
+
+    Returns:
+        results(list): ステージごとの計測結果のdict
+    """
+    benches = {
+        f'iterparse:{reader}': lambda reader=reader: {f'iterparse:{reader}': bench_iterparse(xml_path, reader)}
+        for reader in readers
+    }
+    benches.update({
+        'parse_entity': lambda: bench_parse_entity(xml_path),
+        'parse_article_info': lambda: {'parse_article_info': bench_parse_article_info(xml_path)},
+    })
+    if mongo_uri:
+        benches['mongo_sink'] = lambda: {'mongo_sink': bench_mongo_sink(xml_path, mongo_uri)}
+
+    best = {}
+    for _ in range(repeat):
+        for bench in benches.values():
+            for stage, stats in bench().items():
+                if stage not in best or stats['seconds'] < best[stage]['seconds']:
+                    best[stage] = stats
+
+    common = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'lxml': '.'.join(map(str, etree.LXML_VERSION)),
+        'file': xml_path,
+        'file_bytes': os.path.getsize(xml_path),
+        'repeat': repeat,
+    }
+    results = []
+    for stage, stats in best.items():
+        seconds = stats['seconds']
+        results.append(dict(common, stage=stage, articles=stats['articles'], seconds=round(seconds, 6),
+                            articles_per_sec=round(stats['articles'] / seconds, 1) if seconds else None))
+    return results
+
+
+def write_results(results, output=None):
+    """計測結果をJSON Lines形式で出力する．outputがNoneなら標準出力
+
+    Args:
+        results(list): run_benchmarksの結果
+        output(str): 追記するファイルのパス
+    """
+    lines = ''.join(ujson.dumps(result, ensure_ascii=False) + '\n' for result in results)
+    if output is None:
+        print(lines, end='')
+    else:
+        with open(output, mode='a') as f:
+            f.write(lines)
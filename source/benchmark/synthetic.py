@@ -0,0 +1,191 @@
+import gzip
+import random
+from xml.sax.saxutils import escape
+
+
+_WORDS = ('protein', 'cell', 'expression', 'patients', 'analysis', 'clinical', 'study', 'gene',
+          'treatment', 'response', 'cancer', 'mice', 'receptor', 'activity', 'blood', 'tissue',
+          'signaling', 'mutation', 'therapy', 'risk', 'cohort', 'model', 'effect', 'levels')
+_JOURNALS = [('Biochemical medicine', 'Biochem Med', '0151424', 'United States'),
+             ('The Lancet', 'Lancet', '2985213R', 'England'),
+             ('Nature', 'Nature', '0410462', 'England'),
+             ('Journal of Biological Chemistry', 'J Biol Chem', '2985121R', 'United States'),
+             ('Revue medicale', 'Rev Med', '7609051', 'France')]
+_LANGS = ('eng', 'eng', 'eng', 'fre', 'ger', 'jpn')
+_SECTIONS = ('BACKGROUND', 'METHODS', 'RESULTS', 'CONCLUSIONS')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+DEFAULT_SHAPE = {
+    'authors': (1, 12),
+    'structured_abstract_ratio': 0.3,
+    'abstract_sentences': (3, 12),
+    'references': (0, 40),
+    'mesh_terms': (3, 15),
+    'chemicals': (0, 5),
+    'grants': (0, 3),
+    'keywords': (0, 6),
+    'delete_ratio': 0.01,
+}
+
+
+def _sentence(rng, n_words):
+    return ' '.join(rng.choice(_WORDS) for _ in range(n_words)).capitalize() + '.'
+
+
+def _paragraph(rng, n_sentences):
+    return ' '.join(_sentence(rng, rng.randint(6, 20)) for _ in range(n_sentences))
+
+
+def _ui(rng, prefix, n_vocab):
+    return f'{prefix}{rng.randrange(n_vocab):06d}'
+
+
+def make_article(rng, pmid, shape):
+    """PubmedArticle要素1つ分のXML文字列を作る
+
+    Args:
+        rng(random.Random): 乱数生成器
+        pmid(int): 記事のPMID
+        shape(dict): 記事の形状（DEFAULT_SHAPEと同じキー）
+
+    Returns:
+        xml(str): PubmedArticle要素のXML文字列
+    """
+    title, medline_ta, nlm_unique_id, country = rng.choice(_JOURNALS)
+    year = rng.randint(1950, 2019)
+    version = rng.choice((1, 1, 1, 2))
+
+    parts = [
+        '<PubmedArticle>\n',
+        '<MedlineCitation Status="MEDLINE" Owner="NLM">\n',
+        f'<PMID Version="{version}">{pmid}</PMID>\n',
+        f'<DateCompleted><Year>{year + 1}</Year><Month>01</Month><Day>15</Day></DateCompleted>\n',
+        f'<DateRevised><Year>2019</Year><Month>02</Month><Day>0{rng.randint(1, 9)}</Day></DateRevised>\n',
+        '<Article PubModel="Print">\n<Journal>\n',
+        f'<ISSN IssnType="Print">{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}</ISSN>\n',
+        f'<JournalIssue CitedMedium="Print"><Volume>{rng.randint(1, 300)}</Volume>'
+        f'<Issue>{rng.randint(1, 12)}</Issue><PubDate><Year>{year}</Year>'
+        f'<Month>{rng.choice(_MONTHS)}</Month></PubDate></JournalIssue>\n',
+        f'<Title>{escape(title)}</Title>\n<ISOAbbreviation>{escape(medline_ta)}</ISOAbbreviation>\n',
+        '</Journal>\n',
+        f'<ArticleTitle>{escape(_sentence(rng, rng.randint(5, 20)))}</ArticleTitle>\n',
+        f'<Pagination><MedlinePgn>{rng.randint(1, 500)}-{rng.randint(501, 999)}</MedlinePgn></Pagination>\n',
+        f'<ELocationID EIdType="doi" ValidYN="Y">10.{rng.randint(1000, 9999)}/{pmid}</ELocationID>\n',
+    ]
+
+    n_sentences = rng.randint(*shape['abstract_sentences'])
+    parts.append('<Abstract>\n')
+    if rng.random() < shape['structured_abstract_ratio']:
+        for section in _SECTIONS:
+            parts.append(f'<AbstractText Label="{section}" NlmCategory="{section}">'
+                         f'{escape(_paragraph(rng, max(1, n_sentences // 4)))}</AbstractText>\n')
+    else:
+        parts.append(f'<AbstractText>{escape(_paragraph(rng, n_sentences))}</AbstractText>\n')
+    parts.append('</Abstract>\n')
+
+    parts.append('<AuthorList CompleteYN="Y">\n')
+    for i in range(rng.randint(*shape['authors'])):
+        parts.append(f'<Author ValidYN="Y"><LastName>Author{rng.randrange(5000)}</LastName>'
+                     f'<ForeName>Name{i}</ForeName><Initials>N</Initials>'
+                     f'<AffiliationInfo><Affiliation>Department {rng.randrange(300)}, '
+                     f'University {rng.randrange(100)}.</Affiliation></AffiliationInfo></Author>\n')
+    parts.append('</AuthorList>\n')
+    parts.append(f'<Language>{rng.choice(_LANGS)}</Language>\n')
+
+    n_grants = rng.randint(*shape['grants'])
+    if n_grants:
+        parts.append('<GrantList CompleteYN="Y">\n')
+        for _ in range(n_grants):
+            parts.append(f'<Grant><GrantID>R01 GM{rng.randrange(100000):05d}</GrantID><Acronym>GM</Acronym>'
+                         f'<Agency>NIGMS NIH HHS</Agency><Country>United States</Country></Grant>\n')
+        parts.append('</GrantList>\n')
+    parts.append('<PublicationTypeList><PublicationType UI="D016428">Journal Article</PublicationType>'
+                 '</PublicationTypeList>\n')
+    parts.append('</Article>\n')
+
+    parts.append(f'<MedlineJournalInfo><Country>{country}</Country><MedlineTA>{escape(medline_ta)}</MedlineTA>'
+                 f'<NlmUniqueID>{nlm_unique_id}</NlmUniqueID><ISSNLinking>0000-0000</ISSNLinking>'
+                 f'</MedlineJournalInfo>\n')
+
+    n_chemicals = rng.randint(*shape['chemicals'])
+    if n_chemicals:
+        parts.append('<ChemicalList>\n')
+        for _ in range(n_chemicals):
+            ui = _ui(rng, 'D', 9000)
+            parts.append(f'<Chemical><RegistryNumber>0</RegistryNumber>'
+                         f'<NameOfSubstance UI="{ui}">Substance {ui}</NameOfSubstance></Chemical>\n')
+        parts.append('</ChemicalList>\n')
+    parts.append('<CitationSubset>IM</CitationSubset>\n')
+
+    n_mesh = rng.randint(*shape['mesh_terms'])
+    if n_mesh:
+        parts.append('<MeshHeadingList>\n')
+        for _ in range(n_mesh):
+            ui = _ui(rng, 'D', 30000)
+            major = rng.choice('NY')
+            parts.append(f'<MeshHeading><DescriptorName UI="{ui}" MajorTopicYN="{major}">'
+                         f'Descriptor {ui}</DescriptorName></MeshHeading>\n')
+        parts.append('</MeshHeadingList>\n')
+
+    n_keywords = rng.randint(*shape['keywords'])
+    if n_keywords:
+        parts.append('<KeywordList Owner="NOTNLM">\n')
+        for _ in range(n_keywords):
+            parts.append(f'<Keyword MajorTopicYN="N">{rng.choice(_WORDS)}</Keyword>\n')
+        parts.append('</KeywordList>\n')
+    parts.append('</MedlineCitation>\n')
+
+    parts.append('<PubmedData>\n<PublicationStatus>ppublish</PublicationStatus>\n<ArticleIdList>'
+                 f'<ArticleId IdType="pubmed">{pmid}</ArticleId>'
+                 f'<ArticleId IdType="doi">10.{rng.randint(1000, 9999)}/{pmid}</ArticleId></ArticleIdList>\n')
+    n_references = rng.randint(*shape['references'])
+    if n_references:
+        parts.append('<ReferenceList>\n')
+        for _ in range(n_references):
+            cited = rng.randrange(1, 30000000)
+            parts.append(f'<Reference><Citation>{escape(_sentence(rng, rng.randint(8, 20)))}</Citation>'
+                         f'<ArticleIdList><ArticleId IdType="pubmed">{cited}</ArticleId></ArticleIdList>'
+                         f'</Reference>\n')
+        parts.append('</ReferenceList>\n')
+    parts.append('</PubmedData>\n</PubmedArticle>\n')
+    return ''.join(parts)
+
+
+def generate_pubmed_xml(path, n_articles, seed=0, first_pmid=1, **shape):
+    """再現可能な合成PubmedArticleSetのgzipファイルを作る
+
+    Args:
+        path(str): 出力する.xml.gzのパス
+        n_articles(int): PubmedArticleの数
+        seed(int): 乱数のシード．同じ引数なら同じファイルになる
+        first_pmid(int): 最初の記事のPMID
+        **shape: DEFAULT_SHAPEを上書きする記事の形状（authors=(1, 3)など）
+
+    Returns:
+        n_deletes(int): DeleteCitationに含めたPMIDの数
+    """
+    unknown = set(shape) - set(DEFAULT_SHAPE)
+    if unknown:
+        raise ValueError(f'Unknown shape parameters: {sorted(unknown)}')
+    shape = dict(DEFAULT_SHAPE, **shape)
+    rng = random.Random(seed)
+
+    # mtimeを固定して，同じ引数なら同じバイト列になるようにする
+    with open(path, mode='wb') as raw, \
+            gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+        f.write(b'<?xml version="1.0" encoding="utf-8"?>\n'
+                b'<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2019//EN" '
+                b'"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_190101.dtd">\n'
+                b'<PubmedArticleSet>\n')
+        for pmid in range(first_pmid, first_pmid + n_articles):
+            f.write(make_article(rng, pmid, shape).encode('utf-8'))
+
+        n_deletes = int(n_articles * shape['delete_ratio'])
+        if n_deletes:
+            f.write(b'<DeleteCitation>\n')
+            for pmid in rng.sample(range(first_pmid, first_pmid + n_articles), n_deletes):
+                f.write(f'<PMID Version="1">{pmid}</PMID>\n'.encode('utf-8'))
+            f.write(b'</DeleteCitation>\n')
+        f.write(b'</PubmedArticleSet>\n')
+    return n_deletes
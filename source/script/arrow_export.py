@@ -0,0 +1,116 @@
+import os
+
+import pyarrow as pa
+
+from script.schema import Text, Attrib, AttribList, TextList, TextDict, Records, as_document
+
+
+DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+
+
+def field_type(field):
+    """スキーマのFieldに対応するArrowの型
+
+    Args:
+        field(Field): スキーマのフィールド
+
+    Returns:
+        type(pa.DataType): Text/Attribは文字列（convert=intなら整数，intern=Trueならdictionary型），
+            TextList/AttribListは文字列のリスト，TextDictはmap，Recordsはstructのリスト
+    """
+    if isinstance(field, Attrib) and field.convert is int:
+        return pa.int64()
+    if isinstance(field, Text) and field.intern:
+        # 繰り返し出てくる値は辞書エンコードする（Parquetでも辞書のまま書き出される）
+        return DICTIONARY_STRING
+    if isinstance(field, (Text, Attrib)):
+        return pa.string()
+    if isinstance(field, (TextList, AttribList)):
+        return pa.list_(pa.string())
+    if isinstance(field, TextDict):
+        return pa.map_(pa.string(), pa.string())
+    if isinstance(field, Records):
+        return pa.list_(pa.struct([(name, field_type(sub_field))
+                                   for name, sub_field in field.plan.schema.items()]))
+    raise TypeError(f'{type(field).__name__} cannot be stored in an Arrow column')
+
+
+def arrow_schema(schema, extra_fields=(('base_xml', DICTIONARY_STRING), ('content_hash', pa.string()))):
+    """出力ドキュメントのスキーマからArrowのスキーマを作る
+
+    Args:
+        schema(dict): {フィールド名: Field}（ENTITY_SCHEMAなど）
+        extra_fields(tuple): スキーマの外で追加される列の(名前, 型)
+
+    Returns:
+        schema(pa.Schema): Arrowのスキーマ
+    """
+    return pa.schema([(name, field_type(field)) for name, field in schema.items()] + list(extra_fields))
+
+
+def _converter(field):
+    # map列はdictではなく(key, value)のリストで渡す
+    if isinstance(field, TextDict):
+        return lambda value: list(value.items())
+    if isinstance(field, Records):
+        # structの列はdictで渡す（schema.Recordならdictにする）
+        converters = {name: _converter(sub_field) for name, sub_field in field.plan.schema.items()}
+        converters = {name: conv for name, conv in converters.items() if conv is not None}
+
+        def convert(records):
+            records = [as_document(record) for record in records]
+            if converters:
+                records = [dict(record, **{name: conv(record[name]) for name, conv in converters.items()})
+                           for record in records]
+            return records
+        return convert
+    return None
+
+
+class ArrowConverter:
+    """パースしたドキュメントのリストをArrowのテーブルに変換する
+
+    Args:
+        schema(dict): {フィールド名: Field}
+    """
+
+    def __init__(self, schema):
+        self.schema = arrow_schema(schema)
+        self._converters = {name: _converter(field) for name, field in schema.items()}
+
+    def to_table(self, docs):
+        columns = []
+        for name in self.schema.names:
+            values = [doc.get(name) for doc in docs]
+            conv = self._converters.get(name)
+            if conv is not None:
+                values = [conv(value) if value is not None else None for value in values]
+            columns.append(values)
+        return pa.Table.from_arrays([pa.array(values, type=self.schema.field(name).type)
+                                     for name, values in zip(self.schema.names, columns)],
+                                    schema=self.schema)
+
+
+# パーティションのディレクトリ名（{列名}={値}）に使う列名．
+# Hive形式のパーティションの値は読み込むときに同名の列を上書きするので，base_xml（フルパス）とは別の名前にする
+PARTITION_COLUMNS = {
+    'base_xml': 'base_xml_name',
+    'year': 'year',
+}
+
+
+def partition_value(doc, partition_by):
+    """ドキュメントのパーティションの値
+
+    Args:
+        doc(dict): パースしたドキュメント
+        partition_by(str): 'base_xml'（元のファイル名）か'year'（pubdateの年）
+
+    Returns:
+        value(str): パーティションのディレクトリ名に使う値
+    """
+    if partition_by == 'base_xml':
+        return os.path.basename(doc['base_xml']).split('.')[0]
+    if partition_by == 'year':
+        return doc.get('pubdate') or 'unknown'
+    raise ValueError(f'Unknown partition: {partition_by}')
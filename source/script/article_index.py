@@ -0,0 +1,86 @@
+import argparse
+import os
+
+import numpy as np
+import ujson
+
+from script.gzip_index import GzipIndex, gzip_index_path
+
+
+class ArticleLocator:
+    """PMIDから，その記事を含むファイルと展開後の位置を引く
+
+    ファイルごとのPMIDの範囲（最小，最大）をJSONに記録し，範囲に入るファイルのGzipIndexを調べる．
+    baselineのファイルはPMIDの範囲がほとんど重ならないので，調べるのは数ファイルで済む．
+    複数のファイルに含まれる場合は，ファイル名が後のもの（新しいupdates）を採用する．
+
+    Args:
+        path(str): PMIDの範囲を記録するJSONのパス（'log/article_index.json'など）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            with open(path, mode='r') as f:
+                self.ranges = ujson.load(f)
+        else:
+            self.ranges = {}
+        self._indexes = {}
+
+    def add(self, xml_path):
+        """パースが完了したファイルのGzipIndex（ArticleIndexerが保存したもの）を登録する"""
+        # シークポイントの分は読まない
+        with np.load(gzip_index_path(xml_path)) as arrays:
+            pmids = arrays['article_pmids']
+        self._indexes.pop(xml_path, None)
+        if len(pmids):
+            self.ranges[xml_path] = [int(pmids.min()), int(pmids.max())]
+        else:
+            self.ranges.pop(xml_path, None)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, mode='w') as f:
+            ujson.dump(self.ranges, f, escape_forward_slashes=False)
+        os.replace(tmp_path, self.path)
+
+    def _index(self, xml_path):
+        index = self._indexes.get(xml_path)
+        if index is None:
+            index = GzipIndex.load(gzip_index_path(xml_path))
+            self._indexes[xml_path] = index
+        return index
+
+    def find(self, pmid):
+        """PMIDの記事を含むファイルと展開後の位置
+
+        Args:
+            pmid(int): PMID
+
+        Returns:
+            (xml_path, offset): なければ(None, None)
+        """
+        candidates = sorted((os.path.basename(xml_path), xml_path) for xml_path, (low, high) in self.ranges.items()
+                            if low <= pmid <= high)
+        for _, xml_path in reversed(candidates):
+            offset = self._index(xml_path).locate(pmid)
+            if offset is not None:
+                return xml_path, offset
+        return None, None
+
+    def read_article(self, pmid):
+        """PMIDの<PubmedArticle>要素のXML（bytes）と，それを含むファイル．なければ(None, None)"""
+        xml_path, _ = self.find(pmid)
+        if xml_path is None:
+            return None, None
+        return self._index(xml_path).read_article(xml_path, pmid), xml_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PMIDの記事のXMLを，ファイル全体を読まずに取り出す')
+    parser.add_argument('pmids', nargs='+', type=int)
+    parser.add_argument('--article-index', default='log/article_index.json')
+    args = parser.parse_args()
+    locator = ArticleLocator(args.article_index)
+    for pmid in args.pmids:
+        data, _ = locator.read_article(pmid)
+        print(data.decode('utf-8') if data is not None else f'PMID {pmid} not found')
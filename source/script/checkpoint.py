@@ -0,0 +1,111 @@
+import os
+
+import ujson
+
+
+class CheckpointManifest:
+    """ファイルごとのパースの進捗を記録するマニフェスト（JSON Lines，追記のみ）
+
+    sinkのバッチがコミットされるたびに(ファイル, 処理済みの要素数, 最後のPMID, バッチID)を1行追記し，
+    ファイルが完了したらdoneの行を追記する．読み込むときはファイルごとに最後の行を採用するので，
+    途中で落ちても最後にコミットされたバッチから再開できる．
+    1行は小さいので，複数のワーカープロセスが同じファイルに追記しても行は混ざらない．
+
+    Args:
+        path(str): マニフェストのパス
+        legacy_log(str): 以前のparsed_files.logのパス．記録されたファイルは完了済みとして読み込む
+    """
+
+    def __init__(self, path, legacy_log=None):
+        self.path = path
+        self.states = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        if legacy_log is not None and os.path.exists(legacy_log):
+            with open(legacy_log, mode='r') as f:
+                for line in f:
+                    if line.strip():
+                        self.states[line.rstrip('\n')] = {'file': line.rstrip('\n'), 'done': True}
+        if os.path.exists(path):
+            with open(path, mode='r') as f:
+                for line in f:
+                    try:
+                        state = ujson.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた行は無視する
+                        continue
+                    self.states[state['file']] = state
+
+    def _append(self, state):
+        self.states[state['file']] = state
+        with open(self.path, mode='a') as f:
+            f.write(ujson.dumps(state, ensure_ascii=False, escape_forward_slashes=False) + '\n')
+
+    def is_done(self, xml_path):
+        state = self.states.get(xml_path)
+        return state is not None and state['done']
+
+    def offset(self, xml_path):
+        """コミット済みの要素数（再開時に読み飛ばす数）"""
+        state = self.states.get(xml_path)
+        if state is None or state['done']:
+            return 0
+        return state['offset']
+
+    def commit(self, xml_path, offset, last_pmid, batch_id):
+        self._append({'file': xml_path, 'done': False, 'offset': offset,
+                      'last_pmid': last_pmid, 'batch_id': batch_id})
+
+    def done(self, xml_path, counts=None):
+        self._append({'file': xml_path, 'done': True, 'counts': counts or {}})
+
+    def compact(self):
+        """ファイルごとに最後の状態だけを書き直す．ワーカーが書き込んでいないときに呼ぶこと"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, mode='w') as f:
+            for state in self.states.values():
+                f.write(ujson.dumps(state, ensure_ascii=False, escape_forward_slashes=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+class FileProgress:
+    """1ファイル分の進捗を数え，sinkのバッチがコミットされたらマニフェストに記録する
+
+    Args:
+        manifest(CheckpointManifest): 記録先
+        xml_path(str): パース中のファイル
+        resume(bool): Falseならコミット済みの要素も読み飛ばさずに最初から処理する
+    """
+
+    def __init__(self, manifest, xml_path, resume=True):
+        self.manifest = manifest
+        self.xml_path = xml_path
+        self.offset = manifest.offset(xml_path) if resume else 0
+        self.last_pmid = None
+        self._skip = self.offset
+
+    @property
+    def resumed(self):
+        return self.offset > 0
+
+    def wrap(self, handler, sink):
+        """要素の処理関数を，コミット済みの要素を読み飛ばして進捗をsinkに渡す関数にする"""
+        def func(elem):
+            if self._skip:
+                # コミット済みなのでdictを作らずに飛ばす
+                self._skip -= 1
+                return
+            handler(elem)
+            # sinkに渡し終えてから数える（途中でflushされた場合は保守的に記録される）
+            self.offset += 1
+            if elem.tag == 'PubmedArticle':
+                self.last_pmid = elem.findtext('MedlineCitation/PMID')
+            sink.mark((self.offset, self.last_pmid))
+        return func
+
+    def on_flush(self, stats):
+        # 書き込み先が別スレッドの場合もあるので，バッチに含まれる位置を記録する
+        if stats['position'] is None:
+            return
+        offset, last_pmid = stats['position']
+        self.manifest.commit(self.xml_path, offset, last_pmid, stats['batch_id'])
@@ -0,0 +1,221 @@
+import argparse
+import os
+
+from script.schema import as_document
+
+
+# 辺のテーブルの列（列名, pyarrowの型名）．citing_pmid/pmid，versionとbase_xmlは記事のもの
+EDGE_TABLES = {
+    # 引用している記事 → 引用された文献（PMIDかDOIのどちらかがないことも多い）
+    'citations': (('citing_pmid', 'int64'), ('version', 'int32'), ('base_xml', 'string'), ('position', 'int32'),
+                  ('cited_pmid', 'int64'), ('cited_doi', 'string')),
+    # 記事 → 著者（positionは著者リストでの順番，0始まり）
+    'authors': (('pmid', 'int64'), ('version', 'int32'), ('base_xml', 'string'), ('position', 'int32'),
+                ('lastname', 'string'), ('forename', 'string'), ('initials', 'string'),
+                ('collective', 'string'), ('affiliation', 'string')),
+    # 記事 → コメントや訂正の対象・元の記事（ref_sourceは'Cancer Res. 1975 Jan;35(1):1-5'のような書誌）
+    'comments_corrections': (('pmid', 'int64'), ('version', 'int32'), ('base_xml', 'string'), ('position', 'int32'),
+                             ('ref_pmid', 'int64'), ('ref_source', 'string')),
+}
+
+# 辺のテーブルを作るのに使う記事のフィールド
+EDGE_FIELDS = ('references', 'authors', 'comments_corrections')
+
+
+def _to_pmid(text):
+    # 参考文献のPMIDには数字以外が入っていることがある
+    return int(text) if text and text.isdigit() else None
+
+
+class EdgeWriter:
+    """記事の参考文献と著者を，辺のテーブルとしてParquetに書き出す（ワーカープロセス用）
+
+    記事のドキュメントには参考文献や著者，コメント・訂正が配列で入っているので，引用グラフを作るには
+    全記事を読んで展開する必要がある．パース中に1行1辺のテーブルも{out_dir}/{table}/{name}.parquetに
+    書き出しておけば，そのまま結合や集計に使える．
+    行には記事のversionと元ファイルを入れるので，読み込む側で記事ごとに最大のversionの，
+    その中で最後のファイルの行を採用すること（build_csrはそうする）．DeleteCitationで削除された記事の辺は残る．
+    pyarrowが必要．
+
+    Args:
+        out_dir(str): 出力ディレクトリ
+        name(str): 出力ファイル名（{name}.parquet）
+        batch_size(int): 1回に書き出す最大の行数（テーブルごと）
+        compression(str): Parquetの圧縮方式
+        drop_fields(tuple): 辺のテーブルのためだけに抽出したフィールド．collect()が返すドキュメントからは除く
+    """
+
+    def __init__(self, out_dir, name, batch_size=100000, compression='snappy', drop_fields=()):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('EdgeWriter requires pyarrow: pip install pyarrow')
+        self._pa = pa
+        self._pq = pq
+        self.out_dir = out_dir
+        self.name = name
+        self.batch_size = batch_size
+        self.compression = compression
+        self.drop_fields = tuple(drop_fields)
+        self.schemas = {table: pa.schema([(column, getattr(pa, type_name)()) for column, type_name in columns])
+                        for table, columns in EDGE_TABLES.items()}
+        self.counts = dict.fromkeys(EDGE_TABLES, 0)
+        self._rows = {table: {column: [] for column, _ in columns} for table, columns in EDGE_TABLES.items()}
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def collect(self, doc):
+        """1記事分の辺を追加する
+
+        Args:
+            doc(dict): パースしたドキュメント（schema.Recordも可）
+
+        Returns:
+            doc(dict): sinkに書き込むドキュメント（drop_fieldsがあればそれを除いたdict，なければdocのまま）
+        """
+        pmid = int(doc['_id'])
+        version = doc['version']
+        base_xml = doc['base_xml']
+
+        rows = self._rows['citations']
+        for position, reference in enumerate(doc['references']):
+            article_ids = reference['article_ids']
+            cited_pmid = _to_pmid(article_ids.get('pubmed'))
+            cited_doi = article_ids.get('doi') or None
+            if cited_pmid is None and cited_doi is None:
+                continue
+            rows['citing_pmid'].append(pmid)
+            rows['version'].append(version)
+            rows['base_xml'].append(base_xml)
+            rows['position'].append(position)
+            rows['cited_pmid'].append(cited_pmid)
+            rows['cited_doi'].append(cited_doi)
+
+        rows = self._rows['authors']
+        for position, author in enumerate(doc['authors']):
+            rows['pmid'].append(pmid)
+            rows['version'].append(version)
+            rows['base_xml'].append(base_xml)
+            rows['position'].append(position)
+            for column in ('lastname', 'forename', 'initials', 'collective', 'affiliation'):
+                rows[column].append(author[column])
+
+        rows = self._rows['comments_corrections']
+        for position, comment in enumerate(doc['comments_corrections']):
+            rows['pmid'].append(pmid)
+            rows['version'].append(version)
+            rows['base_xml'].append(base_xml)
+            rows['position'].append(position)
+            rows['ref_pmid'].append(_to_pmid(comment['pmid']))
+            rows['ref_source'].append(comment['ref_source'] or None)
+
+        for table, rows in self._rows.items():
+            if len(rows['version']) >= self.batch_size:
+                self._flush_table(table)
+
+        if self.drop_fields:
+            doc = as_document(doc)
+            for field in self.drop_fields:
+                del doc[field]
+        return doc
+
+    def _flush_table(self, table):
+        rows = self._rows[table]
+        if not rows['version']:
+            return
+        writer = self._writers.get(table)
+        if writer is None:
+            table_dir = os.path.join(self.out_dir, table)
+            os.makedirs(table_dir, exist_ok=True)
+            writer = self._pq.ParquetWriter(os.path.join(table_dir, f'{self.name}.parquet'),
+                                            self.schemas[table], compression=self.compression)
+            self._writers[table] = writer
+        writer.write_table(self._pa.table(rows, schema=self.schemas[table]))
+        self.counts[table] += len(rows['version'])
+        for values in rows.values():
+            values.clear()
+
+    def flush(self):
+        for table in self._rows:
+            self._flush_table(table)
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def build_csr(edges_dir, out_path):
+    """citationsテーブルから，PMID同士の引用グラフの隣接リストをCSR形式で作る
+
+    記事ごとに最大のversionの，その中でファイル名が最後のファイル（同じversionの再配信なら最新のもの）の行だけを使い，
+    PMIDのない参考文献（DOIだけのもの）は除く．再配信で参考文献が変わっていても，前の配信の行は混ざらない．
+    ノードは引用している記事と引用された記事のPMIDを昇順に並べたもので，
+    ノードiの引用先は indices[indptr[i]:indptr[i + 1]]（ノード番号，参考文献の順）になる．
+    scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr))でそのまま疎行列にできる．
+
+    Args:
+        edges_dir(str): EdgeWriterの出力ディレクトリ
+        out_path(str): 出力先の.npz（nodes，indptr，indicesの配列）
+
+    Returns:
+        shape(tuple): (ノード数, 辺の数)
+    """
+    import numpy as np
+    import pyarrow.dataset as ds
+
+    table = ds.dataset(os.path.join(edges_dir, 'citations'), format='parquet').to_table(
+        columns=['citing_pmid', 'version', 'base_xml', 'position', 'cited_pmid'])
+    citing = table['citing_pmid'].to_numpy()
+    version = table['version'].to_numpy()
+    position = table['position'].to_numpy()
+    # 元ファイルはファイル名の順番（updatesの連番の順）に置き換える
+    files = table['base_xml'].combine_chunks().dictionary_encode()
+    names = [os.path.basename(name) for name in files.dictionary.to_pylist()]
+    file_rank = np.argsort(np.argsort(names))[files.indices.to_numpy()]
+    # PMIDのない行は-1にしておき，versionとファイルを決めてから除く
+    cited = table['cited_pmid'].fill_null(-1).to_numpy()
+    del table, files
+
+    order = np.lexsort((position, file_rank, version, citing))
+    citing, version, file_rank, position, cited = \
+        citing[order], version[order], file_rank[order], position[order], cited[order]
+    del order
+
+    # 記事ごとの最大のversionと，その中で最後のファイル（並べ替えたので各記事の最後の行）の行だけを残す
+    starts = np.flatnonzero(np.r_[True, citing[1:] != citing[:-1]])
+    ends = np.r_[starts[1:], len(citing)]
+    keep = ((version == np.repeat(version[ends - 1], ends - starts)) &
+            (file_rank == np.repeat(file_rank[ends - 1], ends - starts)))
+    # 同じファイルに同じ記事が2回ある場合は1つだけにする
+    keep[1:] &= ~((citing[1:] == citing[:-1]) & (version[1:] == version[:-1]) &
+                  (file_rank[1:] == file_rank[:-1]) & (position[1:] == position[:-1]))
+    keep &= cited >= 0
+    citing, cited = citing[keep], cited[keep]
+
+    nodes = np.union1d(citing, cited)
+    src = np.searchsorted(nodes, citing)
+    indices = np.searchsorted(nodes, cited).astype(np.int32)
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(nodes)), out=indptr[1:])
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    np.savez(out_path, nodes=nodes, indptr=indptr, indices=indices)
+    return len(nodes), len(indices)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='辺のテーブルから引用グラフのCSRを作成する')
+    parser.add_argument('edges_dir', help='--edges-dirで書き出したディレクトリ')
+    parser.add_argument('-o', '--out', help='出力先の.npz（デフォルトは<edges_dir>/citation_csr.npz）')
+    args = parser.parse_args()
+    out_path = args.out or os.path.join(args.edges_dir, 'citation_csr.npz')
+    n_nodes, n_edges = build_csr(args.edges_dir, out_path)
+    print(f'{out_path}: {n_nodes} nodes, {n_edges} edges')
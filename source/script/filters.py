@@ -0,0 +1,97 @@
+import re
+
+import numpy as np
+
+
+class PmidSet:
+    """PMIDの集合をビット列で持つ（PMIDの最大値が4千万でも5MB程度）
+
+    数十万件のPMIDのリストでも，Pythonのsetより小さく，ワーカープロセスに渡すのも速い．
+
+    Args:
+        pmids(iterable): PMID（intか数字の文字列）
+    """
+
+    def __init__(self, pmids):
+        pmids = np.asarray([int(pmid) for pmid in pmids], dtype=np.int64)
+        if len(pmids) and pmids.min() < 0:
+            raise ValueError('PMID must not be negative')
+        self._bits = np.zeros((int(pmids.max()) >> 3) + 1 if len(pmids) else 0, dtype=np.uint8)
+        np.bitwise_or.at(self._bits, pmids >> 3, (1 << (pmids & 7)).astype(np.uint8))
+        self.size = len(np.unique(pmids))
+
+    @classmethod
+    def from_file(cls, path):
+        """1行1PMIDのファイルから読み込む"""
+        with open(path, mode='r') as f:
+            return cls(f.read().split())
+
+    def __contains__(self, pmid):
+        pmid = int(pmid)
+        i = pmid >> 3
+        return 0 <= i < len(self._bits) and bool(self._bits[i] >> (pmid & 7) & 1)
+
+    def __len__(self):
+        return self.size
+
+
+class ArticleFilter:
+    """記事を抽出する前に，PMID，出版年，雑誌で絞り込む
+
+    PubmedArticleの要素からPMIDと出版年，NlmUniqueIDの要素だけを見て判定するので，
+    条件に合わない記事はdictを作る前にも，VersionIndexやDBに問い合わせる前にも捨てられる．
+    指定した条件はすべて満たす必要がある（AND）．
+
+    Args:
+        pmids(PmidSet): このPMIDの記事だけを残す
+        pubdate_from(int): この年以降に出版された記事だけを残す
+        pubdate_to(int): この年以前に出版された記事だけを残す
+        nlm_unique_ids(iterable): この雑誌（NlmUniqueID）の記事だけを残す
+    """
+
+    def __init__(self, pmids=None, pubdate_from=None, pubdate_to=None, nlm_unique_ids=None):
+        self.pmids = pmids
+        self.pubdate_from = pubdate_from
+        self.pubdate_to = pubdate_to
+        self.nlm_unique_ids = frozenset(nlm_unique_ids) if nlm_unique_ids is not None else None
+        self.filtered = 0
+
+    def match_pmid(self, pmid):
+        """PMIDの条件だけで判定する（DeleteCitationの絞り込み用）"""
+        return self.pmids is None or pmid in self.pmids
+
+    def match(self, elem):
+        """PubmedArticleの要素が条件に合うか．合わなければ捨てた件数に数える"""
+        if self._match(elem):
+            return True
+        self.filtered += 1
+        return False
+
+    def _match(self, elem):
+        citation = elem.find('MedlineCitation')
+        if self.pmids is not None and citation.findtext('PMID') not in self.pmids:
+            return False
+        if self.nlm_unique_ids is not None and \
+                citation.findtext('MedlineJournalInfo/NlmUniqueID') not in self.nlm_unique_ids:
+            return False
+        if self.pubdate_from is not None or self.pubdate_to is not None:
+            year = pubdate_year(citation)
+            if year is None:
+                return False
+            if self.pubdate_from is not None and year < self.pubdate_from:
+                return False
+            if self.pubdate_to is not None and year > self.pubdate_to:
+                return False
+        return True
+
+
+def pubdate_year(citation):
+    """MedlineCitationの出版年（Yearがなければ MedlineDateの最初の4桁）．なければNone"""
+    pubdate = citation.find('Article/Journal/JournalIssue/PubDate')
+    if pubdate is None:
+        return None
+    year = pubdate.findtext('Year')
+    if year is None:
+        match = re.search(r'\d{4}', pubdate.findtext('MedlineDate') or '')
+        year = match.group() if match else None
+    return int(year) if year is not None and year.isdigit() else None
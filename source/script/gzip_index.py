@@ -0,0 +1,565 @@
+import argparse
+import ctypes
+import ctypes.util
+import io
+import os
+import zlib
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+from lxml import etree
+
+from script.utils import fast_iter
+from script.xml_input import DEFAULT_BUFFER_SIZE
+
+
+# deflateの参照範囲（シークポイントごとに直前の展開済みデータをこのサイズだけ持つ）
+WINDOW_SIZE = 1 << 15
+# シークポイントの間隔（展開後のバイト数）．小さいほど読み出しが速く，インデックスが大きくなる
+DEFAULT_SPAN = 1 << 20
+
+ARTICLE_TAG = b'<PubmedArticle>'
+
+_Z_OK = 0
+_Z_STREAM_END = 1
+_Z_BUF_ERROR = -5
+_Z_NO_FLUSH = 0
+_Z_BLOCK = 5
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+        ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong),
+    ]
+
+
+_libz = None
+
+
+def _load_libz():
+    # PythonのzlibモジュールはinflatePrimeとZ_BLOCKを公開していないので，libzを直接呼ぶ
+    global _libz
+    if _libz is None:
+        path = ctypes.util.find_library('z')
+        if path is None:
+            raise ImportError('gzip index requires the zlib shared library (libz.so)')
+        libz = ctypes.CDLL(path)
+        libz.zlibVersion.restype = ctypes.c_char_p
+        stream_p = ctypes.POINTER(_ZStream)
+        libz.inflateInit2_.argtypes = [stream_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        libz.inflate.argtypes = [stream_p, ctypes.c_int]
+        libz.inflateEnd.argtypes = [stream_p]
+        libz.inflateReset.argtypes = [stream_p]
+        libz.inflateReset2.argtypes = [stream_p, ctypes.c_int]
+        libz.inflatePrime.argtypes = [stream_p, ctypes.c_int, ctypes.c_int]
+        libz.inflateSetDictionary.argtypes = [stream_p, ctypes.c_char_p, ctypes.c_uint]
+        _libz = libz
+    return _libz
+
+
+class _Inflater:
+    """libzのinflateをファイルから読みながら呼ぶ
+
+    Args:
+        f: 圧縮データを読むファイル（読み始める位置にシーク済み）
+        wbits(int): inflateInit2のwindowBits（47はgzip/zlibの自動判定，-15はヘッダーなしのdeflate）
+        chunk_size(int): 1回に読む圧縮データのサイズ
+        out_size(int): 1回のinflateで展開する最大サイズ
+    """
+
+    def __init__(self, f, wbits, chunk_size=DEFAULT_BUFFER_SIZE, out_size=1 << 18):
+        self._z = _load_libz()
+        self._file = f
+        self._strm = _ZStream()
+        self._in = ctypes.create_string_buffer(chunk_size)
+        self._out = ctypes.create_string_buffer(out_size)
+        self._check(self._z.inflateInit2_(ctypes.byref(self._strm), wbits, self._z.zlibVersion(),
+                                          ctypes.sizeof(_ZStream)))
+        self.in_offset = f.tell()
+        self.ended = False
+
+    def _check(self, ret):
+        if ret not in (_Z_OK, _Z_STREAM_END, _Z_BUF_ERROR):
+            message = self._strm.msg.decode() if self._strm.msg else f'code {ret}'
+            raise zlib.error(f'Error -{abs(ret)} while decompressing data: {message}')
+        return ret
+
+    def fill(self):
+        """入力が空なら次の圧縮データを読む．ファイルの終わりならFalse"""
+        if self._strm.avail_in:
+            return True
+        n = self._file.readinto(self._in)
+        self._strm.next_in = ctypes.addressof(self._in)
+        self._strm.avail_in = n
+        return n > 0
+
+    def skip_input(self, n):
+        """入力をnバイトまで読み飛ばし，読み飛ばしたバイト数を返す"""
+        n = min(n, self._strm.avail_in)
+        self._strm.next_in += n
+        self._strm.avail_in -= n
+        self.in_offset += n
+        return n
+
+    def prime(self, bits, value):
+        self._check(self._z.inflatePrime(ctypes.byref(self._strm), bits, value))
+
+    def set_dictionary(self, window):
+        self._check(self._z.inflateSetDictionary(ctypes.byref(self._strm), window, len(window)))
+
+    def reset(self, wbits=None):
+        self.ended = False
+        if wbits is None:
+            self._check(self._z.inflateReset(ctypes.byref(self._strm)))
+        else:
+            self._check(self._z.inflateReset2(ctypes.byref(self._strm), wbits))
+
+    def inflate(self, flush=_Z_NO_FLUSH):
+        """1回inflateを呼び，展開したデータを返す"""
+        strm = self._strm
+        strm.next_out = ctypes.addressof(self._out)
+        strm.avail_out = len(self._out)
+        avail_in = strm.avail_in
+        ret = self._check(self._z.inflate(ctypes.byref(strm), flush))
+        self.in_offset += avail_in - strm.avail_in
+        if ret == _Z_STREAM_END:
+            self.ended = True
+        return ctypes.string_at(ctypes.addressof(self._out), len(self._out) - strm.avail_out)
+
+    @property
+    def at_block_boundary(self):
+        # Z_BLOCKで止まったのがdeflateのブロックの区切り（最後のブロックの後を除く）か
+        data_type = self._strm.data_type
+        return bool(data_type & 128) and not data_type & 64
+
+    @property
+    def unused_bits(self):
+        return self._strm.data_type & 7
+
+    def close(self):
+        self._z.inflateEnd(ctypes.byref(self._strm))
+
+
+class IndexingReader(io.RawIOBase):
+    """.gzを展開しながら，シークポイントと<PubmedArticle>の位置を記録するストリーム
+
+    zlibのexamples/zran.cと同じく，deflateのブロックの区切りでspanバイトごとに
+    (展開後の位置, 圧縮データの位置, 端数のビット数, 直前32KBの展開済みデータ)を記録する．
+    連結されたgzip（複数メンバー）にも対応し，途中で切れていればEOFErrorを投げる．
+    .gzでなければそのまま読み，<PubmedArticle>の位置だけを記録する．
+
+    Args:
+        path(str): .xml.gzのパス
+        span(int): シークポイントの間隔（展開後のバイト数）
+        chunk_size(int): 1回に読む圧縮データのサイズ
+    """
+
+    def __init__(self, path, span=DEFAULT_SPAN, chunk_size=DEFAULT_BUFFER_SIZE):
+        super().__init__()
+        self._file = open(path, mode='rb')
+        self._chunk_size = chunk_size
+        self._inflater = _Inflater(self._file, 47, chunk_size) if path.endswith('.gz') else None
+        self.span = span
+        self.points = []
+        self.article_offsets = []
+        self.size = 0
+        self._window = b''
+        self._tail = b''
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def _record(self, data):
+        # <PubmedArticle>はテキスト中では'<'がエスケープされるので，出てくれば要素の開始タグ
+        buf = self._tail + data
+        base = self.size - len(self._tail)
+        i = buf.find(ARTICLE_TAG)
+        while i >= 0:
+            self.article_offsets.append(base + i)
+            i = buf.find(ARTICLE_TAG, i + 1)
+        self._tail = buf[-(len(ARTICLE_TAG) - 1):]
+        self.size += len(data)
+        if self._inflater is not None:
+            self._window = (self._window + data)[-WINDOW_SIZE:]
+
+    def inflate(self):
+        """次の展開済みデータ．終わりならb''"""
+        if self._inflater is None:
+            data = self._file.read(self._chunk_size)
+            self._record(data)
+            return data
+        inflater = self._inflater
+        while True:
+            if not inflater.fill():
+                if inflater.ended:
+                    return b''
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            if inflater.ended:
+                # 次のメンバー
+                inflater.reset()
+            data = inflater.inflate(_Z_BLOCK)
+            if data:
+                self._record(data)
+            if inflater.at_block_boundary and not inflater.ended and \
+                    (not self.points or self.size - self.points[-1][0] >= self.span):
+                self.points.append((self.size, inflater.in_offset, inflater.unused_bits, self._window))
+            if data:
+                return data
+
+    def readinto(self, b):
+        if not self._pending:
+            self._pending = memoryview(self.inflate())
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if self._inflater is not None:
+            self._inflater.close()
+            self._inflater = None
+        self._file.close()
+        super().close()
+
+
+class SeekReader(io.RawIOBase):
+    """インデックスのシークポイントから展開を始め，展開後のoffsetから読むストリーム
+
+    Args:
+        path(str): .xml.gzのパス
+        index(GzipIndex): pathのインデックス
+        offset(int): 読み始める展開後の位置
+    """
+
+    def __init__(self, path, index, offset):
+        super().__init__()
+        self._file = open(path, mode='rb')
+        self._inflater = None
+        if not path.endswith('.gz'):
+            self._file.seek(offset)
+            self._skip = 0
+            return
+        out, in_offset, bits, window = index.point_before(offset)
+        self._file.seek(in_offset - 1 if bits else in_offset)
+        self._inflater = _Inflater(self._file, -15, 1 << 16)
+        if bits:
+            # ブロックの区切りがバイトの途中なので，残りのビットを先に渡す
+            value = self._file.read(1)[0]
+            self._inflater.in_offset += 1
+            self._inflater.prime(bits, value >> (8 - bits))
+        if window:
+            self._inflater.set_dictionary(window)
+        self._skip = offset - out
+        self._trailer = 0
+        # シークポイントのメンバーはヘッダーなしで展開するので，終わりのCRC32とサイズは自分で飛ばす
+        self._raw = True
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def _inflate(self):
+        inflater = self._inflater
+        while True:
+            if not inflater.fill():
+                if inflater.ended and not self._trailer:
+                    return b''
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            if inflater.ended:
+                # メンバーの終わり．CRC32とサイズ（8バイト）を飛ばして次のメンバーのヘッダーから読む
+                self._trailer -= inflater.skip_input(self._trailer)
+                if self._trailer:
+                    continue
+                if not inflater.fill():
+                    return b''
+                inflater.reset(47)
+                self._raw = False
+            data = inflater.inflate()
+            if inflater.ended and self._raw:
+                self._trailer = 8
+            if data:
+                return data
+
+    def readinto(self, b):
+        if self._inflater is None:
+            return self._file.readinto(b)
+        while not self._pending:
+            data = self._inflate()
+            if not data:
+                return 0
+            if self._skip:
+                n = min(self._skip, len(data))
+                self._skip -= n
+                data = data[n:]
+            self._pending = memoryview(data)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if self._inflater is not None:
+            self._inflater.close()
+            self._inflater = None
+        self._file.close()
+        super().close()
+
+
+class ArticleRangeReader(io.RawIOBase):
+    """start番目からend番目の手前までの記事だけを，<PubmedArticleSet>で囲んで読むストリーム
+
+    直前のシークポイントから展開するので，1つのファイルを記事の範囲に分けて別々のプロセスでパースできる．
+    最後の範囲は元のファイルの終わり（DeleteCitationと閉じタグ）まで読む．
+
+    Args:
+        path(str): .xml.gzのパス
+        index(GzipIndex): pathのインデックス
+        start(int): 最初の記事の番号（ファイル順，0始まり）
+        end(int): 最後の記事の次の番号
+    """
+
+    def __init__(self, path, index, start, end):
+        super().__init__()
+        n_articles = len(index.article_offsets)
+        begin = int(index.article_offsets[start])
+        stop = int(index.article_offsets[end]) if end < n_articles else index.size
+        self._source = SeekReader(path, index, begin)
+        self._remaining = stop - begin
+        self._prefix = memoryview(b'<PubmedArticleSet>\n')
+        self._suffix = memoryview(b'</PubmedArticleSet>\n' if end < n_articles else b'')
+
+    def readable(self):
+        return True
+
+    def _copy(self, b, data):
+        n = min(len(b), len(data))
+        b[:n] = data[:n]
+        return n
+
+    def readinto(self, b):
+        if self._prefix:
+            n = self._copy(b, self._prefix)
+            self._prefix = self._prefix[n:]
+            return n
+        if self._remaining:
+            n = self._source.readinto(memoryview(b)[:self._remaining])
+            if not n:
+                raise EOFError('Compressed file ended before the end of the article range')
+            self._remaining -= n
+            return n
+        n = self._copy(b, self._suffix)
+        self._suffix = self._suffix[n:]
+        return n
+
+    def close(self):
+        self._source.close()
+        super().close()
+
+
+def gzip_index_path(xml_path):
+    """インデックスのパス（.xml.gzと同じディレクトリに置く）"""
+    return xml_path + '.index.npz'
+
+
+class GzipIndex:
+    """.xml.gzのシークポイントと，記事（<PubmedArticle>）ごとのPMIDと展開後の位置
+
+    Args:
+        points(list): (展開後の位置, 圧縮データの位置, 端数のビット数, 直前の展開済みデータ)のリスト
+        article_pmids(array): 記事のPMID（ファイル順）
+        article_offsets(array): 記事の<PubmedArticle>の展開後の位置（ファイル順）
+        size(int): 展開後のサイズ
+    """
+
+    def __init__(self, points, article_pmids, article_offsets, size):
+        self.points = points
+        self.article_pmids = np.asarray(article_pmids, dtype='<u4')
+        self.article_offsets = np.asarray(article_offsets, dtype='<i8')
+        self.size = size
+        self._point_out = np.array([point[0] for point in points], dtype='<i8')
+        # PMIDで引くための並び（同じPMIDが複数あれば後のものを使う）
+        self._order = np.argsort(self.article_pmids, kind='stable')
+
+    def point_before(self, offset):
+        """offset以前で最も近いシークポイント"""
+        i = np.searchsorted(self._point_out, offset, side='right') - 1
+        if i < 0:
+            raise ValueError(f'No seek point before offset {offset}')
+        return self.points[i]
+
+    def locate(self, pmid):
+        """PMIDの記事の展開後の位置．なければNone"""
+        pmids = self.article_pmids[self._order]
+        i = np.searchsorted(pmids, pmid, side='right') - 1
+        if i < 0 or pmids[i] != pmid:
+            return None
+        return int(self.article_offsets[self._order[i]])
+
+    def open(self, xml_path, offset, buffer_size=1 << 16):
+        """展開後のoffsetから読むファイルオブジェクト"""
+        return io.BufferedReader(SeekReader(xml_path, self, offset), buffer_size)
+
+    def open_articles(self, xml_path, start, end, buffer_size=DEFAULT_BUFFER_SIZE):
+        """start番目からend番目の手前までの記事を読むファイルオブジェクト（ArticleRangeReaderを参照）"""
+        return io.BufferedReader(ArticleRangeReader(xml_path, self, start, end), buffer_size)
+
+    def compressed_bytes(self, xml_path, start, end):
+        """start番目からend番目の手前までの記事の圧縮データのバイト数（シークポイントの単位で近似）
+
+        ファイルを範囲に分けたときの合計は，ファイルのサイズに一致する．
+        """
+        n_articles = len(self.article_offsets)
+        begin = self.point_before(int(self.article_offsets[start]))[1] if start > 0 else 0
+        stop = (self.point_before(int(self.article_offsets[end]))[1] if end < n_articles
+                else os.path.getsize(xml_path))
+        return stop - begin
+
+    def read_article(self, xml_path, pmid):
+        """PMIDの<PubmedArticle>要素のXML．なければNone"""
+        offset = self.locate(pmid)
+        if offset is None:
+            return None
+        end_tag = b'</PubmedArticle>'
+        data = b''
+        with self.open(xml_path, offset) as f:
+            while True:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    raise EOFError(f'</PubmedArticle> not found for PMID {pmid}')
+                start = max(len(data) - len(end_tag), 0)
+                data += chunk
+                end = data.find(end_tag, start)
+                if end >= 0:
+                    return data[:end + len(end_tag)]
+
+    def save(self, path):
+        windows = [zlib.compress(point[3]) for point in self.points]
+        window_offsets = np.zeros(len(windows) + 1, dtype='<i8')
+        np.cumsum([len(window) for window in windows], out=window_offsets[1:])
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode='wb') as f:
+            np.savez(f,
+                     point_out=self._point_out,
+                     point_in=np.array([point[1] for point in self.points], dtype='<i8'),
+                     point_bits=np.array([point[2] for point in self.points], dtype='u1'),
+                     windows=np.frombuffer(b''.join(windows), dtype='u1'),
+                     window_offsets=window_offsets,
+                     article_pmids=self.article_pmids,
+                     article_offsets=self.article_offsets,
+                     size=np.array(self.size, dtype='<i8'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            windows = arrays['windows'].tobytes()
+            window_offsets = arrays['window_offsets']
+            points = [(int(out), int(in_offset), int(bits),
+                       zlib.decompress(windows[window_offsets[i]:window_offsets[i + 1]]))
+                      for i, (out, in_offset, bits) in enumerate(zip(arrays['point_out'], arrays['point_in'],
+                                                                     arrays['point_bits']))]
+            return cls(points, arrays['article_pmids'], arrays['article_offsets'], int(arrays['size']))
+
+
+class ArticleIndexer:
+    """1ファイルをパースしながら，そのファイルのGzipIndexを作る
+
+    open()で開いたストリームでパースし，wrap()した処理関数に全要素を渡すと，
+    k番目のPubmedArticleのPMIDとk番目の<PubmedArticle>の位置を対応づけられる．
+
+    Args:
+        xml_path(str): パースする.xml.gzのパス
+        span(int): シークポイントの間隔（展開後のバイト数）
+    """
+
+    def __init__(self, xml_path, span=DEFAULT_SPAN):
+        self.xml_path = xml_path
+        self.span = span
+        self.pmids = []
+        self._reader = None
+
+    def open(self):
+        self._reader = IndexingReader(self.xml_path, self.span)
+        return io.BufferedReader(self._reader, DEFAULT_BUFFER_SIZE)
+
+    def wrap(self, handler):
+        """要素の処理関数を，PubmedArticleのPMIDをファイル順に記録する関数にする"""
+        pmids = self.pmids
+
+        def func(elem):
+            if elem.tag == 'PubmedArticle':
+                pmids.append(int(elem.findtext('MedlineCitation/PMID')))
+            handler(elem)
+        return func
+
+    def build(self):
+        reader = self._reader
+        if len(self.pmids) != len(reader.article_offsets):
+            raise ValueError(f'{self.xml_path}: {len(self.pmids)} articles but '
+                             f'{len(reader.article_offsets)} <PubmedArticle> tags')
+        return GzipIndex(reader.points, self.pmids, reader.article_offsets, reader.size)
+
+    def save(self):
+        """インデックスを.xml.gzの隣に保存し，そのパスを返す"""
+        path = gzip_index_path(self.xml_path)
+        self.build().save(path)
+        return path
+
+
+def article_ranges(xml_path, articles_per_range):
+    """インデックスのある.xml.gzの記事をarticles_per_range件ずつに分けた(start, end)のリスト
+
+    Args:
+        xml_path(str): .xml.gzのパス
+        articles_per_range(int): 1つの範囲の記事数
+
+    Returns:
+        ranges(list): (start, end)のリスト．インデックスがなければNone
+    """
+    path = gzip_index_path(xml_path)
+    if not os.path.exists(path):
+        return None
+    # シークポイントの分は読まない
+    with np.load(path) as arrays:
+        n_articles = len(arrays['article_offsets'])
+    return [(start, min(start + articles_per_range, n_articles))
+            for start in range(0, n_articles, articles_per_range)]
+
+
+def build_index(xml_path, span=DEFAULT_SPAN, overwrite=False):
+    """パースせずに（PMIDだけを読んで）.xml.gzのインデックスを作り，隣に保存する
+
+    Args:
+        xml_path(str): .xml.gzのパス
+        span(int): シークポイントの間隔（展開後のバイト数）
+        overwrite(bool): 保存済みでも作り直すか
+
+    Returns:
+        path(str): 保存したインデックスのパス
+    """
+    path = gzip_index_path(xml_path)
+    if os.path.exists(path) and not overwrite:
+        return path
+    indexer = ArticleIndexer(xml_path, span)
+    with indexer.open() as f:
+        fast_iter(etree.iterparse(f, events=('end',), tag='PubmedArticle'), indexer.wrap(lambda elem: None))
+    return indexer.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='.xml.gzのシークポイントと記事の位置のインデックスを作成する')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('-p', '--processes', type=int, default=1)
+    parser.add_argument('--span', type=int, default=DEFAULT_SPAN, help='シークポイントの間隔（展開後のバイト数）')
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+    with Pool(args.processes) as pool:
+        for index_path in pool.imap_unordered(partial(build_index, span=args.span, overwrite=args.overwrite),
+                                              args.paths):
+            print(index_path)
@@ -1,10 +1,16 @@
 import re
+from functools import lru_cache
 import numpy as np
-from itertools import chain
-from script.utils import read_xml, stringify_children, month_or_day_formater
+from lxml import etree
+from script.utils import release_element, stringify_children, month_or_day_formater
+from script.xml_input import open_xml
+from script.schema import ExtractionPlan, Elem, Elems
 
 __all__ = [
+    'iter_medline_xml',
+    'iter_medline_records',
     'parse_medline_xml',
+    'parse_medline_records',
     'parse_medline_grant_id'
 ]
 
@@ -22,11 +28,11 @@ def parse_pmid(medline):
     pmid: str
         String version of the PubMed ID
     """
-    if medline.find('PMID') is not None:
-        pmid = medline.find('PMID').text
-    else:
-        pmid = ''
-    return pmid
+    return _format_pmid(medline.find('PMID'))
+
+
+def _format_pmid(pmid):
+    return pmid.text if pmid is not None else ''
 
 
 def parse_mesh_terms(medline):
@@ -43,17 +49,11 @@ def parse_mesh_terms(medline):
         String of semi-colon spearated MeSH (Medical Subject Headings)
         terms contained in the document.
     """
-    if medline.find('MeshHeadingList') is not None:
-        mesh = medline.find('MeshHeadingList')
-        mesh_terms_list = [
-            m.find('DescriptorName').attrib.get('UI', '') +
-            ":" +
-            m.find('DescriptorName').text for m in mesh.getchildren()
-        ]
-        mesh_terms = '; '.join(mesh_terms_list)
-    else:
-        mesh_terms = ''
-    return mesh_terms
+    return _format_mesh_terms(medline.findall('MeshHeadingList/MeshHeading/DescriptorName'))
+
+
+def _format_mesh_terms(descriptors):
+    return '; '.join(d.attrib.get('UI', '') + ':' + d.text for d in descriptors)
 
 
 def parse_publication_types(medline):
@@ -69,16 +69,11 @@ def parse_publication_types(medline):
     publication_types: str
         String of semi-colon spearated publication types
     """
-    publication_types = []
-    publication_type_list = medline.find('Article/PublicationTypeList')
-    if publication_type_list is not None:
-        publication_type_list = publication_type_list.findall('PublicationType')
-        for publication_type in publication_type_list:
-            publication_types.append(
-                publication_type.attrib.get('UI', '') + ':' + (publication_type.text.strip() or '')
-            )
-    publication_types = '; '.join(publication_types)
-    return publication_types
+    return _format_ui_names(medline.findall('Article/PublicationTypeList/PublicationType'))
+
+
+def _format_ui_names(elems):
+    return '; '.join(e.attrib.get('UI', '') + ':' + (e.text.strip() or '') for e in elems)
 
 
 def parse_keywords(medline):
@@ -94,16 +89,11 @@ def parse_keywords(medline):
     keywords: str
         String of concatenated keywords.
     """
-    keyword_list = medline.find('KeywordList')
-    keywords = list()
-    if keyword_list is not None:
-        for k in keyword_list.findall('Keyword'):
-            if k.text is not None:
-                keywords.append(k.text)
-        keywords = '; '.join(keywords)
-    else:
-        keywords = ''
-    return keywords
+    return _format_keywords(medline.findall('KeywordList/Keyword'))
+
+
+def _format_keywords(keywords):
+    return '; '.join(k.text for k in keywords if k.text is not None)
 
 
 def parse_chemical_list(medline):
@@ -119,16 +109,7 @@ def parse_chemical_list(medline):
     chemical_list: str
         String of semi-colon spearated chemical list
     """
-    chemical_list = []
-    chemicals  = medline.find('ChemicalList')
-    if chemicals is not None:
-        for chemical in chemicals.findall('Chemical'):
-            substance_name = chemical.find('NameOfSubstance')
-            chemical_list.append(
-                substance_name.attrib.get('UI', '') + ':' + (substance_name.text.strip() or '')
-            )
-    chemical_list = '; '.join(chemical_list)
-    return chemical_list
+    return _format_ui_names(medline.findall('ChemicalList/Chemical/NameOfSubstance'))
 
 
 def parse_other_id(medline):
@@ -144,21 +125,20 @@ def parse_other_id(medline):
     other_id: str
         String of semi-colon separated Other IDs found in the document
     """
+    return _format_other_id(medline.findall('OtherID'))
+
+
+def _format_other_id(oids):
     pmc = ''
     other_id = list()
-    oids = medline.findall('OtherID')
-    if oids is not None:
-        for oid in oids:
-            if 'PMC' in oid.text:
-                pmc = oid.text
-            else:
-                other_id.append(oid.text)
-        other_id = '; '.join(other_id)
-    else:
-        other_id = ''
+    for oid in oids:
+        if 'PMC' in oid.text:
+            pmc = oid.text
+        else:
+            other_id.append(oid.text)
     return {
         'pmc': pmc,
-        'other_id': other_id
+        'other_id': '; '.join(other_id)
     }
 
 
@@ -178,42 +158,29 @@ def parse_journal_info(medline):
 
     """
     journal_info = medline.find('MedlineJournalInfo')
-    if journal_info is not None:
-        if journal_info.find('MedlineTA') is not None:
-            medline_ta = journal_info.find('MedlineTA').text or ''  # equivalent to Journal name
-        else:
-            medline_ta = ''
-        if journal_info.find('NlmUniqueID') is not None:
-            nlm_unique_id = journal_info.find('NlmUniqueID').text or ''
-        else:
-            nlm_unique_id = ''
-        if journal_info.find('ISSNLinking') is not None:
-            issn_linking = journal_info.find('ISSNLinking').text
-        else:
-            issn_linking = ''
-        if journal_info.find('Country') is not None:
-            country = journal_info.find('Country').text or ''
-        else:
-            country = ''
-    else:
-        medline_ta = ''
-        nlm_unique_id = ''
-        issn_linking = ''
-        country = ''
-    dict_info = {'medline_ta': medline_ta.strip(),
-                 'nlm_unique_id': nlm_unique_id,
-                 'issn_linking': issn_linking,
-                 'country': country}
-    return dict_info
-
-
-def parse_grant_id(medline):
+    if journal_info is None:
+        return _format_journal_info(None, None, None, None)
+    return _format_journal_info(journal_info.find('MedlineTA'), journal_info.find('NlmUniqueID'),
+                                journal_info.find('ISSNLinking'), journal_info.find('Country'))
+
+
+def _format_journal_info(medline_ta, nlm_unique_id, issn_linking, country):
+    # MedlineTA is equivalent to Journal name
+    return {'medline_ta': (medline_ta.text or '').strip() if medline_ta is not None else '',
+            'nlm_unique_id': (nlm_unique_id.text or '') if nlm_unique_id is not None else '',
+            'issn_linking': issn_linking.text if issn_linking is not None else '',
+            'country': (country.text or '') if country is not None else ''}
+
+
+def parse_grant_id(medline, pmid=None):
     """Parse Grant ID and related information from a given MEDLINE tree
 
     Parameters
     ----------
     medline: Element
         The lxml node pointing to a medline document
+    pmid: str, optional
+        PubMed ID of the document if it is already parsed
 
     Returns
     -------
@@ -223,7 +190,8 @@ def parse_grant_id(medline):
         grant ID, grant acronym, country, and agency.
     """
     article = medline.find('Article')
-    pmid = parse_pmid(medline)
+    if pmid is None:
+        pmid = parse_pmid(medline)
 
     grants = article.find('GrantList')
     grant_list = list()
@@ -274,12 +242,13 @@ def parse_doi(medline):
     doi: str, DOI from a given lxml node
     """
     article = medline.find('Article')
-    elocation_ids = article.findall('ELocationID')
+    return _format_doi(article.findall('ELocationID'))
+
 
+def _format_doi(elocation_ids):
     doi = ''
-    if len(elocation_ids) > 0:
-        for e in elocation_ids:
-            doi = e.text.strip() or '' if e.attrib.get('EIdType', '') == 'doi' else ''
+    for e in elocation_ids:
+        doi = e.text.strip() or '' if e.attrib.get('EIdType', '') == 'doi' else ''
     return doi
 
 
@@ -296,37 +265,109 @@ def parse_author_affiliation(medline):
     authors: list
         List of authors and their corresponding affiliation in dictionary format
     """
-    authors = []
-    article = medline.find('Article')
-    if article is not None:
-        author_list = article.find('AuthorList')
-        if author_list is not None:
-            authors_list = author_list.findall('Author')
-            for author in authors_list:
-                if author.find('ForeName') is not None:
-                    forename = (author.find('ForeName').text or '').strip() or ''
-                else:
-                    forename = ''
-                if author.find('Initials') is not None:
-                    firstname = (author.find('Initials').text or '').strip() or ''
-                else:
-                    firstname = ''
-                if author.find('LastName') is not None:
-                    lastname = (author.find('LastName').text or '').strip() or ''
-                else:
-                    lastname = ''
-                if author.find('AffiliationInfo/Affiliation') is not None:
-                    affiliation = author.find('AffiliationInfo/Affiliation').text or ''
-                    affiliation = affiliation.replace("For a full list of the authors' affiliations please see the Acknowledgements section.", '')
-                else:
-                    affiliation = ''
-                authors.append({
-                    'forename': forename,
-                    'firstname': firstname, 
-                    'lastname': lastname,
-                    'affiliation': affiliation
-                })
-    return authors
+    return [_format_author(author) for author in medline.findall('Article/AuthorList/Author')]
+
+
+def _element_text(elem):
+    return (elem.text or '').strip() if elem is not None else ''
+
+
+def _format_author(author):
+    affiliation = author.find('AffiliationInfo/Affiliation')
+    if affiliation is not None:
+        affiliation = affiliation.text or ''
+        affiliation = affiliation.replace("For a full list of the authors' affiliations please see the Acknowledgements section.", '')
+    else:
+        affiliation = ''
+    return {
+        'forename': _element_text(author.find('ForeName')),
+        'firstname': _element_text(author.find('Initials')),
+        'lastname': _element_text(author.find('LastName')),
+        'affiliation': affiliation
+    }
+
+
+def parse_author_records(medline, pmid):
+    """Parse authors of an article as one record per author
+
+    Parameters
+    ----------
+    medline: Element
+        The lxml node pointing to a medline document
+    pmid: str
+        PubMed ID of the document
+
+    Returns
+    -------
+    author_records: list
+        List of dictionaries returned by `parse_author_affiliation` with
+        the `pmid` and the 1-origin `position` of the author added
+    """
+    return [dict(author, pmid=pmid, position=i)
+            for i, author in enumerate(parse_author_affiliation(medline), start=1)]
+
+
+def parse_mesh_records(medline, pmid):
+    """Parse MeSH headings of an article as one record per descriptor
+
+    Parameters
+    ----------
+    medline: Element
+        The lxml node pointing to a medline document
+    pmid: str
+        PubMed ID of the document
+
+    Returns
+    -------
+    mesh_records: list
+        List of dictionaries with `pmid`, `mesh_id`, `term` and
+        `major_topic` of each descriptor
+    """
+    mesh_records = []
+    for descriptor in medline.findall('MeshHeadingList/MeshHeading/DescriptorName'):
+        mesh_records.append({
+            'pmid': pmid,
+            'mesh_id': descriptor.attrib.get('UI', ''),
+            'term': (descriptor.text or '').strip(),
+            'major_topic': descriptor.attrib.get('MajorTopicYN', '') == 'Y'
+        })
+    return mesh_records
+
+
+def parse_references(medline, pmid):
+    """Parse the reference list of an article
+
+    The reference list is stored in `PubmedData`, the sibling of
+    `MedlineCitation`, so the list is empty for MedlineCitationSet files.
+
+    Parameters
+    ----------
+    medline: Element
+        The lxml node pointing to a medline document
+    pmid: str
+        PubMed ID of the document
+
+    Returns
+    -------
+    references: list
+        List of dictionaries with `pmid`, `citation` and the PubMed ID
+        (`pmid_cited`) and DOI (`doi_cited`) of the cited article
+    """
+    references = []
+    pubmed_article = medline.getparent()
+    if pubmed_article is None or pubmed_article.tag != 'PubmedArticle':
+        return references
+    for reference in pubmed_article.findall('PubmedData/ReferenceList/Reference'):
+        citation = reference.find('Citation')
+        article_ids = {article_id.attrib.get('IdType', ''): (article_id.text or '').strip()
+                       for article_id in reference.findall('ArticleIdList/ArticleId')}
+        references.append({
+            'pmid': pmid,
+            'citation': stringify_children(citation).strip() if citation is not None else '',
+            'pmid_cited': article_ids.get('pubmed', ''),
+            'doi_cited': article_ids.get('doi', '')
+        })
+    return references
 
 
 def date_extractor(journal, year_info_only):
@@ -350,12 +391,16 @@ def date_extractor(journal, year_info_only):
         Note: If year_info_only is False and a month could not be
         extracted this falls back to year automatically.
     """
-    day = None
-    month = None
     issue = journal.xpath('JournalIssue')[0]
-    issue_date = issue.find('PubDate')
+    return _format_pubdate(issue.find('PubDate'), year_info_only)
+
 
-    if issue_date.find('Year') is not None:
+def _format_pubdate(issue_date, year_info_only):
+    day = None
+    month = None
+    if issue_date is None:
+        year = ""
+    elif issue_date.find('Year') is not None:
         year = issue_date.find('Year').text
         if not year_info_only:
             if issue_date.find('Month') is not None:
@@ -378,7 +423,68 @@ def date_extractor(journal, year_info_only):
         return "-".join(str(x) for x in filter(None, [year, month, day]))
 
 
-def parse_article_info(medline, year_info_only, nlm_category, author_list):
+# Elements used by parse_article_info, relative to MedlineCitation. The schema
+# is compiled once so that every article is traversed in a single walk.
+MEDLINE_SCHEMA = {
+    'pmid': Elem('PMID'),
+    'title': Elem('Article/ArticleTitle'),
+    'abstract': Elem('Article/Abstract'),
+    'abstract_texts': Elems('Article/Abstract/AbstractText'),
+    'authors': Elems('Article/AuthorList/Author'),
+    'journal_titles': Elems('Article/Journal/Title'),
+    'pubdate': Elem('Article/Journal/JournalIssue/PubDate'),
+    'elocation_ids': Elems('Article/ELocationID'),
+    'mesh_terms': Elems('MeshHeadingList/MeshHeading/DescriptorName'),
+    'publication_types': Elems('Article/PublicationTypeList/PublicationType'),
+    'chemical_list': Elems('ChemicalList/Chemical/NameOfSubstance'),
+    'keywords': Elems('KeywordList/Keyword'),
+    'other_ids': Elems('OtherID'),
+    'medline_ta': Elem('MedlineJournalInfo/MedlineTA'),
+    'nlm_unique_id': Elem('MedlineJournalInfo/NlmUniqueID'),
+    'issn_linking': Elem('MedlineJournalInfo/ISSNLinking'),
+    'country': Elem('MedlineJournalInfo/Country'),
+}
+MEDLINE_PLAN = ExtractionPlan(MEDLINE_SCHEMA)
+
+# Elements of MEDLINE_SCHEMA needed by each output field of parse_article_info
+ARTICLE_FIELD_ELEMENTS = {
+    'title': ('title',),
+    'abstract': ('abstract', 'abstract_texts'),
+    'journal': ('journal_titles',),
+    'authors': ('authors',),
+    'affiliations': ('authors',),
+    'pubdate': ('pubdate',),
+    'pmid': ('pmid',),
+    'mesh_terms': ('mesh_terms',),
+    'publication_types': ('publication_types',),
+    'chemical_list': ('chemical_list',),
+    'keywords': ('keywords',),
+    'doi': ('elocation_ids',),
+    'delete': (),
+    'other_id': ('other_ids',),
+    'pmc': ('other_ids',),
+    'medline_ta': ('medline_ta',),
+    'nlm_unique_id': ('nlm_unique_id',),
+    'issn_linking': ('issn_linking',),
+    'country': ('country',),
+}
+
+# Values of the elements when they are not extracted
+_EMPTY_ELEMS = {name: field.build(()) for name, field in MEDLINE_SCHEMA.items()}
+
+
+@lru_cache(maxsize=None)
+def _article_plan(fields):
+    unknown = set(fields) - set(ARTICLE_FIELD_ELEMENTS)
+    if unknown:
+        raise ValueError(f'Unknown article fields: {sorted(unknown)}')
+    return MEDLINE_PLAN.project(name for field in fields for name in ARTICLE_FIELD_ELEMENTS[field])
+
+
+_text_nodes = etree.XPath('text()')
+
+
+def parse_article_info(medline, year_info_only, nlm_category, author_list, fields=None):
     """Parse article nodes from Medline dataset
 
     Parameters
@@ -390,6 +496,10 @@ def parse_article_info(medline, year_info_only, nlm_category, author_list):
     nlm_category: bool
         see: parse_medline_xml()
     author_list: bool, if True, return output as list, else
+    fields: list, optional
+        Output fields to extract (keys of `ARTICLE_FIELD_ELEMENTS`). The
+        elements needed only by the other fields, e.g. the author list or
+        the abstract, are not visited at all. Defaults to all fields.
 
     Returns
     -------
@@ -398,21 +508,27 @@ def parse_article_info(medline, year_info_only, nlm_category, author_list):
         `title`, `abstract`, `journal`, `authors`, `affiliations`, `pubdate`,
         `pmid`, `other_id`, `mesh_terms`, and `keywords`. The field
         `delete` is always `False` because this function parses
-        articles that by definition are not deleted.
+        articles that by definition are not deleted. Only the keys in
+        `fields` are returned when it is given.
     """
-    article = medline.find('Article')
+    if fields is None:
+        elems = MEDLINE_PLAN.apply(medline)
+    else:
+        fields = tuple(fields)
+        elems = dict(_EMPTY_ELEMS, **_article_plan(fields).apply(medline))
 
-    if article.find('ArticleTitle') is not None:
-        title = stringify_children(article.find('ArticleTitle')).strip() or ''
+    if elems['title'] is not None:
+        title = stringify_children(elems['title']).strip() or ''
     else:
         title = ''
 
     category = 'NlmCategory' if nlm_category else 'Label'
-    if article.find('Abstract/AbstractText') is not None:
+    abstract_texts = elems['abstract_texts']
+    if abstract_texts:
         # parsing structured abstract
-        if len(article.findall('Abstract/AbstractText')) > 1:
+        if len(abstract_texts) > 1:
             abstract_list = list()
-            for abstract in article.findall('Abstract/AbstractText'):
+            for abstract in abstract_texts:
                 section = abstract.attrib.get(category, '')
                 if section != 'UNASSIGNED':
                     abstract_list.append('\n')
@@ -421,54 +537,222 @@ def parse_article_info(medline, year_info_only, nlm_category, author_list):
                 abstract_list.append(section_text)
             abstract = '\n'.join(abstract_list).strip()
         else:
-            abstract = stringify_children(article.find('Abstract/AbstractText')).strip() or ''
-    elif article.find('Abstract') is not None:
-        abstract = stringify_children(article.find('Abstract')).strip() or ''
+            abstract = stringify_children(abstract_texts[0]).strip() or ''
+    elif elems['abstract'] is not None:
+        abstract = stringify_children(elems['abstract']).strip() or ''
     else:
         abstract = ''
 
-    authors_dict = parse_author_affiliation(medline)
+    authors_dict = [_format_author(author) for author in elems['authors']]
     if not author_list:
-        affiliations = ';'.join([author.get('affiliation', '') 
-                                for author in authors_dict if author.get('affiliation', '') is not ''])
+        affiliations = ';'.join([author.get('affiliation', '')
+                                for author in authors_dict if author.get('affiliation', '') != ''])
         authors = ';'.join([author.get('firstname', '') + ' ' + author.get('lastname', '')
                             for author in authors_dict])
     else:
         authors = authors_dict
-    journal = article.find('Journal')
-    journal_name = ' '.join(journal.xpath('Title/text()'))
-
-    pubdate = date_extractor(journal, year_info_only)
-    pmid = parse_pmid(medline)
-    doi = parse_doi(medline)
-    mesh_terms = parse_mesh_terms(medline)
-    publication_types = parse_publication_types(medline)
-    chemical_list = parse_chemical_list(medline)
-    keywords = parse_keywords(medline)
-    other_id_dict = parse_other_id(medline)
-    journal_info_dict = parse_journal_info(medline)
+    journal_name = ' '.join(text for title_elem in elems['journal_titles']
+                            for text in _text_nodes(title_elem))
+
     dict_out = {
         'title': title,
         'abstract': abstract,
         'journal': journal_name,
         'authors': authors,
-        'pubdate': pubdate,
-        'pmid': pmid,
-        'mesh_terms': mesh_terms,
-        'publication_types': publication_types,
-        'chemical_list': chemical_list,
-        'keywords': keywords,
-        'doi': doi,
+        'pubdate': _format_pubdate(elems['pubdate'], year_info_only),
+        'pmid': _format_pmid(elems['pmid']),
+        'mesh_terms': _format_mesh_terms(elems['mesh_terms']),
+        'publication_types': _format_ui_names(elems['publication_types']),
+        'chemical_list': _format_ui_names(elems['chemical_list']),
+        'keywords': _format_keywords(elems['keywords']),
+        'doi': _format_doi(elems['elocation_ids']),
         'delete': False
     }
     if not author_list:
         dict_out.update({'affiliations': affiliations})
-    dict_out.update(other_id_dict)
-    dict_out.update(journal_info_dict)
+    dict_out.update(_format_other_id(elems['other_ids']))
+    dict_out.update(_format_journal_info(elems['medline_ta'], elems['nlm_unique_id'],
+                                         elems['issn_linking'], elems['country']))
+    if fields is not None:
+        dict_out = {field: dict_out[field] for field in fields if field in dict_out}
     return dict_out
 
 
-def parse_medline_xml(path, year_info_only=True, nlm_category=False, author_list=False):
+def parse_delete_citation(pmid):
+    """Build the record of a deleted article
+
+    Parameters
+    ----------
+    pmid: Element
+        The lxml node pointing to a PMID under DeleteCitation
+
+    Returns
+    -------
+    dict_delete: dict
+        Dictionary with the same keys as `parse_article_info`, where every
+        field other than `pmid` is NaN and `delete` is `True`
+    """
+    return {
+        'title': np.nan,
+        'abstract': np.nan,
+        'journal': np.nan,
+        'authors': np.nan,
+        'affiliations': np.nan,
+        'pubdate': np.nan,
+        'pmid': pmid.text,
+        'doi': np.nan,
+        'other_id': np.nan,
+        'pmc': np.nan,
+        'mesh_terms': np.nan,
+        'keywords': np.nan,
+        'publication_types': np.nan,
+        'chemical_list': np.nan,
+        'delete': True,
+        'medline_ta': np.nan,
+        'nlm_unique_id': np.nan,
+        'issn_linking': np.nan,
+        'country': np.nan,
+    }
+
+
+def _iter_medline_elements(path):
+    """Iterate over MedlineCitation and DeleteCitation elements of a file
+
+    Every element is cleared, together with its preceding siblings, once
+    the caller resumes the generator, so memory usage does not grow with
+    the size of the file.
+    """
+    with open_xml(path) as f:
+        context = etree.iterparse(f, events=('end',),
+                                  tag=('PubmedArticle', 'MedlineCitation', 'DeleteCitation'))
+        for _, elem in context:
+            if elem.tag == 'MedlineCitation':
+                parent = elem.getparent()
+                if parent is not None and parent.tag == 'PubmedArticle':
+                    # PubmedArticleの終了時にまとめて処理する
+                    continue
+                yield elem
+            elif elem.tag == 'PubmedArticle':
+                yield elem.find('MedlineCitation')
+            else:
+                yield elem
+            release_element(elem)
+        del context
+
+
+def iter_medline_records(path, streams=('articles',), year_info_only=True,
+                         nlm_category=False, author_list=False, fields=None):
+    """Extract several record streams from a Medline XML file in a single pass
+
+    Each `MedlineCitation` is parsed once and handed to the parser of every
+    registered stream, so e.g. articles and grants can be collected without
+    reading the file twice.
+
+    Parameters
+    ----------
+    path: str
+        The path to the XML file, either plain or gzipped
+    streams: list or dict
+        Names of the record streams to extract, chosen from `articles`,
+        `grants`, `authors`, `references` and `mesh`. A dict mapping
+        stream names to callables `parser(medline, pmid) -> list` can be
+        given to register custom streams.
+    year_info_only: bool
+        see: parse_medline_xml()
+    nlm_category: bool
+        see: parse_medline_xml()
+    author_list: bool
+        see: parse_article_info()
+    fields: list, optional
+        see: parse_article_info()
+
+    Yields
+    ------
+    (stream, record): tuple
+        Name of the stream and one record of it, in the order they appear
+        in the file. Deleted articles (see `parse_delete_citation`) are
+        yielded in the `articles` stream.
+    """
+    if not isinstance(streams, dict):
+        parse_articles = lambda medline, pmid: [
+            parse_article_info(medline, year_info_only, nlm_category, author_list, fields)
+        ]
+        parsers = {
+            'articles': parse_articles,
+            'grants': parse_grant_id,
+            'authors': parse_author_records,
+            'references': parse_references,
+            'mesh': parse_mesh_records,
+        }
+        unknown = set(streams) - set(parsers)
+        if unknown:
+            raise ValueError(f'Unknown record streams: {sorted(unknown)}')
+        streams = {name: parsers[name] for name in streams}
+
+    for elem in _iter_medline_elements(path):
+        if elem.tag == 'DeleteCitation':
+            if 'articles' in streams:
+                for pmid in elem.findall('PMID'):
+                    yield 'articles', parse_delete_citation(pmid)
+            continue
+        pmid = parse_pmid(elem)
+        for name, parser in streams.items():
+            for record in parser(elem, pmid):
+                yield name, record
+
+
+def parse_medline_records(path, streams=('articles',), year_info_only=True,
+                          nlm_category=False, author_list=False, fields=None):
+    """Extract several record streams from a Medline XML file into lists
+
+    Parameters
+    ----------
+    path: str
+        The path to the XML file, either plain or gzipped
+    streams: list or dict
+        see: iter_medline_records()
+
+    Returns
+    -------
+    records: dict
+        Dictionary mapping each stream name to the list of its records
+    """
+    records = {name: [] for name in streams}
+    for name, record in iter_medline_records(path, streams, year_info_only,
+                                             nlm_category, author_list, fields):
+        records[name].append(record)
+    return records
+
+
+def iter_medline_xml(path, year_info_only=True, nlm_category=False, author_list=False, fields=None):
+    """Iterate over articles of a Medline XML file without loading the whole tree
+
+    Parameters
+    ----------
+    path: str
+        The path to the XML file, either plain or gzipped
+    year_info_only: bool
+        see: parse_medline_xml()
+    nlm_category: bool
+        see: parse_medline_xml()
+    author_list: bool
+        see: parse_article_info()
+    fields: list, optional
+        see: parse_article_info()
+
+    Yields
+    ------
+    article: dict
+        Dictionary containing information about the article (see
+        `parse_article_info`), or the record of a deleted article (see
+        `parse_delete_citation`), in the order they appear in the file
+    """
+    for _, article in iter_medline_records(path, ('articles',), year_info_only,
+                                           nlm_category, author_list, fields):
+        yield article
+
+
+def parse_medline_xml(path, year_info_only=True, nlm_category=False, author_list=False, fields=None):
     """Parse XML file from Medline XML format available at
     ftp://ftp.nlm.nih.gov/nlmdata/.medleasebaseline/gz/
 
@@ -489,44 +773,19 @@ def parse_medline_xml(path, year_info_only=True, nlm_category=False, author_list
         if True, this will parse structured abstract where each section if original Label
         if False, this will parse structured abstract where each section will be assigned to
         NLM category of each sections
+    fields: list, optional
+        Output fields to extract, see: parse_article_info(). Deleted
+        articles keep all their keys.
 
     Returns
     -------
     article_list: list
         Dictionary containing information about articles in NLM format (see
         `parse_article_info`). Articles that have been deleted will be
-        added with no information other than the field `delete` being `True`
+        added with no information other than the field `delete` being `True`.
+        Use `iter_medline_xml` to process large files one article at a time.
     """
-
-    tree = read_xml(path)
-    medline_citations = tree.findall('//MedlineCitationSet/MedlineCitation')
-    if len(medline_citations) == 0:
-        medline_citations = tree.findall('//MedlineCitation')
-    article_list = list(map(lambda m: parse_article_info(m, year_info_only, nlm_category, author_list), medline_citations))
-    delete_citations = tree.findall('//DeleteCitation/PMID')
-    dict_delete = [{
-        'title': np.nan,
-        'abstract': np.nan,
-        'journal': np.nan,
-        'authors': np.nan,
-        'affiliations': np.nan,
-        'pubdate': np.nan,
-        'pmid': p.text,
-        'doi': np.nan,
-        'other_id': np.nan,
-        'pmc': np.nan,
-        'mesh_terms': np.nan,
-        'keywords': np.nan,
-        'publication_types': np.nan, 
-        'chemical_list': np.nan,
-        'delete': True,
-        'medline_ta': np.nan,
-        'nlm_unique_id': np.nan,
-        'issn_linking': np.nan,
-        'country': np.nan,
-    } for p in delete_citations]
-    article_list.extend(dict_delete)
-    return article_list
+    return list(iter_medline_xml(path, year_info_only, nlm_category, author_list, fields))
 
 
 def parse_medline_grant_id(path):
@@ -541,12 +800,8 @@ def parse_medline_grant_id(path):
     -------
     grant_id_list: list
         List of dictionaries for all files in `path`. Each dictionary
-        will have the information returned by `parse_grant_id`
+        will have the information returned by `parse_grant_id`.
+        Use `parse_medline_records` to extract grants together with
+        other record streams in a single pass.
     """
-    tree = read_xml(path)
-    medline_citations = tree.findall('//MedlineCitationSet/MedlineCitation')
-    if len(medline_citations) == 0:
-        medline_citations = tree.findall('//MedlineCitation')
-    grant_id_list = list(map(parse_grant_id, medline_citations))
-    grant_id_list = list(chain(*grant_id_list)) # flatten list
-    return grant_id_list
\ No newline at end of file
+    return parse_medline_records(path, ('grants',))['grants']
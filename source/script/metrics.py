@@ -0,0 +1,287 @@
+import cProfile
+import collections
+import gc
+import os
+import resource
+import signal
+import time
+from contextlib import contextmanager
+
+import ujson
+
+
+# ステージの名前（記録順）
+STAGES = ('read', 'xml_parse', 'extract', 'version_check', 'write')
+
+
+class TimedReader:
+    """read()の時間とバイト数を数えるファイルオブジェクトのラッパー（展開の時間の計測用）"""
+
+    def __init__(self, f, metrics):
+        self._f = f
+        self._metrics = metrics
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._f.read(size)
+        self._metrics.stages['read'] += time.perf_counter() - start
+        self._metrics.bytes_read += len(data)
+        return data
+
+
+class FileMetrics:
+    """1ファイル分のステージごとの時間と件数
+
+    readは展開（ファイルの読み込み），xml_parseはlxmlのパースと要素の解放，
+    extractはdictの作成，version_checkはVersionIndexの判定，writeはsinkへの書き込みの時間．
+    xml_parseとextractは全体の時間から他のステージを引いて求める．
+
+    Args:
+        xml_path(str): パースするファイル
+    """
+
+    def __init__(self, xml_path):
+        self.xml_path = xml_path
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.articles = 0
+        self.bytes_read = 0
+        # ファイルの一部（記事の範囲）だけを読む場合は，その分の圧縮データのバイト数を設定する
+        self.bytes_in = None
+        self.seconds = 0.0
+        self._handler_seconds = 0.0
+        self._start = None
+        # 計測中のステージ（入れ子の呼び出しを二重に数えないため）
+        self._active = set()
+
+    def wrap_input(self, f):
+        return TimedReader(f, self)
+
+    def timed(self, stage, func):
+        """funcの時間をstageに積算する関数を返す
+
+        同じステージの計測中に呼ばれた分（write()の中のflush()など）は外側の呼び出しに含まれるので数えない．
+        """
+        stages = self.stages
+        active = self._active
+
+        def wrapper(*args, **kwargs):
+            if stage in active:
+                return func(*args, **kwargs)
+            active.add(stage)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stages[stage] += time.perf_counter() - start
+                active.discard(stage)
+        return wrapper
+
+    def wrap_handler(self, handler):
+        def func(elem):
+            start = time.perf_counter()
+            handler(elem)
+            self._handler_seconds += time.perf_counter() - start
+            if elem.tag == 'PubmedArticle':
+                self.articles += 1
+        return func
+
+    def instrument(self, sink, index=None):
+        """sinkとインデックスのメソッドを計測用に差し替える"""
+        for method in ('write', 'delete', 'flush'):
+            setattr(sink, method, self.timed('write', getattr(sink, method)))
+        if index is not None:
+            index.check = self.timed('version_check', index.check)
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def loop_done(self):
+        """要素のループが終わったときに呼ぶ．xml_parseとextractをここまでの時間から求める"""
+        loop_seconds = time.perf_counter() - self._start
+        self.stages['extract'] = max(self._handler_seconds - self.stages['version_check']
+                                     - self.stages['write'], 0.0)
+        self.stages['xml_parse'] = max(loop_seconds - self.stages['read'] - self._handler_seconds, 0.0)
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self._start
+
+    def record(self, counts=None):
+        """JSON Linesに書き出す1行分のdict"""
+        seconds = self.seconds or 1e-9
+        record = {
+            'file': self.xml_path,
+            'seconds': round(self.seconds, 6),
+            'stages': {stage: round(value, 6) for stage, value in self.stages.items()},
+            'articles': self.articles,
+            'articles_per_sec': round(self.articles / seconds, 1),
+            'bytes_in': self.bytes_in if self.bytes_in is not None else os.path.getsize(self.xml_path),
+            'bytes_read': self.bytes_read,
+            'bytes_per_sec': round(self.bytes_read / seconds, 1),
+            'rss_max_bytes': rss_max_bytes(),
+        }
+        if counts:
+            record['counts'] = dict(counts)
+        return record
+
+
+def rss_max_bytes():
+    """このプロセスのRSSの最大値（Linuxのru_maxrssはKB単位）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss_bytes():
+    """このプロセスの現在のRSS（/proc/self/statmがなければ最大値で代用）"""
+    try:
+        with open('/proc/self/statm', mode='r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return rss_max_bytes()
+
+
+class RssGuard:
+    """RSSが上限を超えたら，sinkをflushしてバッファと書き込み待ちのキューを空にする
+
+    check_interval要素ごとにRSSを確認する．ThreadedSinkの場合はflushがキューを書き終えるまで待つので，
+    パースが書き込みを追い越してメモリが増えるのを抑える（スロットリング）．
+
+    Args:
+        max_rss_bytes(int): RSSの上限
+        sink(BaseSink): 上限を超えたときにflushする書き込み先
+        check_interval(int): RSSを確認する間隔（要素数）
+        logger: 上限を超えたときに警告を出力するlogger
+    """
+
+    def __init__(self, max_rss_bytes, sink, check_interval=1000, logger=None):
+        self.max_rss_bytes = max_rss_bytes
+        self.sink = sink
+        self.check_interval = check_interval
+        self.logger = logger
+        self.triggered = 0
+        self._count = 0
+
+    def wrap(self, handler):
+        def func(elem):
+            handler(elem)
+            self._count += 1
+            if self._count % self.check_interval == 0:
+                self.check()
+        return func
+
+    def check(self):
+        if current_rss_bytes() <= self.max_rss_bytes:
+            return
+        self.triggered += 1
+        self.sink.flush()
+        gc.collect()
+        rss = current_rss_bytes()
+        if rss > self.max_rss_bytes and self.logger is not None:
+            self.logger.warning(f'RSS {rss // 2 ** 20}MB exceeds {self.max_rss_bytes // 2 ** 20}MB after flush')
+
+
+class MetricsExporter:
+    """ファイルごとの計測結果をJSON Linesに追記し，合計をPrometheusのテキスト形式で書き出す
+
+    Args:
+        path(str): 出力先のプレフィックス．{path}.jsonlと{path}.prom（node_exporterのtextfile用）に書く
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.totals = collections.Counter()
+        self.stage_totals = collections.Counter()
+        self.count_totals = collections.Counter()
+        self.rss_max_bytes = 0
+        self.files = 0
+
+    def add(self, record, file_done=True):
+        """計測結果を追記する
+
+        Args:
+            record(dict): FileMetrics.record()の戻り値
+            file_done(bool): ファイルの完了として数えるか（記事の範囲ごとの結果は最後の範囲だけTrueにする）
+        """
+        with open(self.path + '.jsonl', mode='a') as f:
+            f.write(ujson.dumps(record, ensure_ascii=False, escape_forward_slashes=False) + '\n')
+
+        if file_done:
+            self.files += 1
+        for key in ('seconds', 'articles', 'bytes_in', 'bytes_read'):
+            self.totals[key] += record[key]
+        self.stage_totals.update(record['stages'])
+        self.count_totals.update({key: value for key, value in record.get('counts', {}).items()
+                                  if key != 'seconds'})
+        self.rss_max_bytes = max(self.rss_max_bytes, record['rss_max_bytes'])
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        lines = [
+            '# TYPE pubmed_parser_files_total counter',
+            f'pubmed_parser_files_total {self.files}',
+            '# TYPE pubmed_parser_articles_total counter',
+            f'pubmed_parser_articles_total {self.totals["articles"]}',
+            '# TYPE pubmed_parser_bytes_total counter',
+            f'pubmed_parser_bytes_total{{kind="compressed"}} {self.totals["bytes_in"]}',
+            f'pubmed_parser_bytes_total{{kind="decompressed"}} {self.totals["bytes_read"]}',
+            '# TYPE pubmed_parser_seconds_total counter',
+            f'pubmed_parser_seconds_total {self.totals["seconds"]:.6f}',
+            '# TYPE pubmed_parser_stage_seconds_total counter',
+        ]
+        lines += [f'pubmed_parser_stage_seconds_total{{stage="{stage}"}} {self.stage_totals[stage]:.6f}'
+                  for stage in STAGES]
+        lines.append('# TYPE pubmed_parser_documents_total counter')
+        lines += [f'pubmed_parser_documents_total{{result="{key}"}} {value}'
+                  for key, value in sorted(self.count_totals.items())]
+        lines += [
+            '# TYPE pubmed_parser_rss_max_bytes gauge',
+            f'pubmed_parser_rss_max_bytes {self.rss_max_bytes}',
+        ]
+        tmp_path = self.path + '.prom.tmp'
+        with open(tmp_path, mode='w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path + '.prom')
+
+
+@contextmanager
+def profile(out_path, mode='cprofile', interval=0.005):
+    """ブロック内の処理をプロファイルする
+
+    Args:
+        out_path(str): 出力先．cprofileはpstatsの形式，sampleはflamegraph.pl用のcollapsed stacks
+        mode(str): 'cprofile'（全関数呼び出しを計測）か'sample'（interval秒ごとにスタックを記録，
+            オーバーヘッドが小さい．メインスレッドでのみ使える）
+        interval(float): サンプリングの間隔（秒）
+    """
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(out_path)
+        return
+    if mode != 'sample':
+        raise ValueError(f'Unknown profile mode: {mode}')
+
+    stacks = collections.Counter()
+
+    def sample(signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        stacks[';'.join(reversed(names))] += 1
+
+    previous = signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, previous)
+        with open(out_path, mode='w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
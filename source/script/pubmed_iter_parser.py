@@ -1,230 +1,732 @@
-import gzip
+import argparse
+import hashlib
+import os
+import re
+import time
 from glob import glob
+from multiprocessing import Pool
 
+import ujson
 from lxml import etree
 from pymongo import MongoClient
 from tqdm import tqdm
-from functools import partial
-from script.utils import make_logger
+from functools import partial, lru_cache
+from script.utils import make_logger, fast_iter
+from script.sink import MongoSink, JsonlSink, ParquetSink, ThreadedSink
+from script.version_index import VersionIndex
+from script.checkpoint import CheckpointManifest, FileProgress
+from script.xml_input import open_xml, READERS
+from script.metrics import FileMetrics, MetricsExporter, RssGuard, profile as profile_block
+from script.schema import ExtractionPlan, Record, Text, Attrib, AttribList, TextList, TextDict, Records
+from script.vocabulary import VOCABULARY_FIELDS, Vocabulary, FileVocabularyStore, MongoVocabularyStore
+from script.edges import EDGE_FIELDS, EdgeWriter
+from script.filters import ArticleFilter, PmidSet
+from script.gzip_index import ArticleIndexer, GzipIndex, gzip_index_path, article_ranges
+from script.article_index import ArticleLocator
 import traceback
 
 
-# MongoDBのコレクションを取得
-client = MongoClient('mongodb://mongo:27017', username='root', password='example')
-db = client.pubmed_database
-collection = db.pubmed_article
-
-
-def fast_iter(context, func):
-    for _, elem in context:
-        func(elem)
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
-    del context
-
-
-def get_elem_text(par_elem, elem_path: str):
-    if par_elem.find(elem_path) is not None:
-        elem_text = ''.join(par_elem.find(elem_path).itertext()).strip()
+# MongoClientはforkをまたいで共有できないので，プロセスごとに作成する
+_client = None
+_client_pid = None
+
+
+def get_collection():
+    """このプロセス用のMongoDBのコレクションを取得
+
+    Returns:
+        collection: pubmed_articleコレクション
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = MongoClient('mongodb://mongo:27017', username='root', password='example')
+        _client_pid = os.getpid()
+    return _client.pubmed_database.pubmed_article
+
+
+AUTHOR_SCHEMA = {
+    'lastname': Text('LastName'),
+    'forename': Text('ForeName'),
+    'initials': Text('Initials'),
+    'collective': Text('CollectiveName'),
+    'affiliation': Text('AffiliationInfo/Affiliation'),
+}
+
+GRANT_SCHEMA = {
+    'grant_id': Text('GrantID'),
+    'agency': Text('Agency', intern=True),
+    'country': Text('Country', intern=True),
+}
+
+REFERENCE_SCHEMA = {
+    'citation': Text('Citation'),
+    'article_ids': TextDict('ArticleIdList/ArticleId', 'IdType'),
+}
+
+COMMENTS_CORRECTIONS_SCHEMA = {
+    'ref_source': Text('RefSource'),
+    'pmid': Text('PMID'),
+}
+
+_article_path = 'MedlineCitation/Article/'
+
+# parse_entityが出力するドキュメントのスキーマ（パスはPubmedArticleからの相対パス）
+ENTITY_SCHEMA = {
+    '_id': Text('MedlineCitation/PMID'),
+    'version': Attrib('MedlineCitation/PMID', 'Version', convert=int),
+    'date_completed': Text('MedlineCitation/DateCompleted/Year', intern=True),
+    'date_revised': Text('MedlineCitation/DateRevised/Year', intern=True),
+    'title': Text(_article_path + 'ArticleTitle'),
+    'authors': Records(_article_path + 'AuthorList/Author', AUTHOR_SCHEMA, 'Author'),
+    'pubdate': Text(_article_path + 'Journal/JournalIssue/PubDate/Year', intern=True),
+    'journal': Text(_article_path + 'Journal/Title', intern=True),
+    'volume': Text(_article_path + 'Journal/JournalIssue/Volume', intern=True),
+    'issue': Text(_article_path + 'Journal/JournalIssue/Issue', intern=True),
+    'page': Text(_article_path + 'Pagination/MedlinePgn'),
+    'issn': Text(_article_path + 'Journal/ISSN', intern=True),
+    'issn_linking': Text('MedlineCitation/MedlineJournalInfo/ISSNLinking', intern=True),
+    'iso_abbreviation': Text(_article_path + 'Journal/ISOAbbreviation', intern=True),
+    'medline_ta': Text('MedlineCitation/MedlineJournalInfo/MedlineTA', intern=True),
+    'abstract': TextList(_article_path + 'Abstract/AbstractText'),
+    'other_abstract': TextList('MedlineCitation/OtherAbstract/AbstractText'),
+    'lang': Text(_article_path + 'Language', intern=True),
+    'country': Text('MedlineCitation/MedlineJournalInfo/Country', intern=True),
+    'nlm_unique_id': Text('MedlineCitation/MedlineJournalInfo/NlmUniqueID', intern=True),
+    'other_id': TextDict('MedlineCitation/OtherID', 'Source'),
+    'publication_types': TextDict(_article_path + 'PublicationTypeList/PublicationType', 'UI', intern=True),
+    'keywords': TextList('MedlineCitation/KeywordList/Keyword'),
+    'mesh_terms': TextDict('MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName', 'UI', intern=True),
+    'chemical_list': TextDict('MedlineCitation/ChemicalList/Chemical/NameOfSubstance', 'UI', intern=200000),
+    'grants': Records(_article_path + 'GrantList/Grant', GRANT_SCHEMA, 'Grant'),
+    'article_ids': TextDict('PubmedData/ArticleIdList/ArticleId', 'IdType'),
+    'references': Records('PubmedData/ReferenceList/Reference', REFERENCE_SCHEMA, 'Reference'),
+    'number_of_reference': Text('MedlineCitation/NumberOfReferences', intern=True),
+    'citation_subset': Text('MedlineCitation/CitationSubset', intern=True),
+    'comments_corrections': Records('MedlineCitation/CommentsCorrectionsList/CommentsCorrections',
+                                    COMMENTS_CORRECTIONS_SCHEMA, 'CommentsCorrection'),
+    'publication_status': Text('PubmedData/PublicationStatus', intern=True),
+}
+
+# --vocabularyのときの出力のスキーマ．MeSHと化学物質はUIのリストにし，名前は語彙のテーブルに分ける
+ENTITY_ID_SCHEMA = dict(
+    ENTITY_SCHEMA,
+    mesh_terms=AttribList('MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName', 'UI'),
+    chemical_list=AttribList('MedlineCitation/ChemicalList/Chemical/NameOfSubstance', 'UI', intern_size=200000),
+)
+
+# スキーマはimport時に一度だけコンパイルする
+ENTITY_PLAN = ExtractionPlan(ENTITY_SCHEMA, 'Article', extra_fields=('base_xml', 'content_hash'))
+# 1記事分のレコードの型（フィールドはENTITY_SCHEMAの順とbase_xml，content_hash）
+Article = ENTITY_PLAN.record_type
+
+# --fieldsで指定しなくても必ず抽出するフィールド（sinkがVersionの比較に使う）
+REQUIRED_FIELDS = ('_id', 'version')
+
+
+@lru_cache(maxsize=None)
+def entity_plan(fields=None):
+    """指定したフィールドだけを抽出するプラン．NoneならENTITY_PLAN
+
+    Args:
+        fields(tuple): ENTITY_SCHEMAのフィールド名（'_id'と'version'は指定しなくても含める）
+
+    Returns:
+        plan(ExtractionPlan): 抽出プラン（フィールドの組ごとに一度だけ作る）
+    """
+    if fields is None:
+        return ENTITY_PLAN
+    return ENTITY_PLAN.project(REQUIRED_FIELDS + tuple(fields))
+
+
+# content_hashに含めないフィールド（DateRevisedだけが変わった再配信は同じ内容とみなす）
+HASH_EXCLUDED_FIELDS = ('base_xml', 'date_revised', 'content_hash')
+
+
+@lru_cache(maxsize=None)
+def _hashed_fields(keys):
+    # ハッシュに含めるフィールドを名前順に並べたもの（レコードの型やdictのキーの組ごとに一度だけ作る）
+    return tuple(sorted(key for key in keys if key not in HASH_EXCLUDED_FIELDS))
+
+
+def _content_values(doc):
+    # フィールド名の順に値を並べたリスト．入れ子のレコード（著者など）も値のリストにするので，
+    # schema.Recordをdictにせずにスロットから直接読める
+    if isinstance(doc, Record):
+        values = [getattr(doc, key) for key in _hashed_fields(doc.__slots__)]
     else:
-        elem_text = ''
-    return elem_text
-
-
-def  get_elem_attrib(par_elem,  elem_path: str, attrib: str):
-    if par_elem.find(elem_path) is not None:
-        elem_attrib = par_elem.find(elem_path).attrib.get(attrib, '')
-    else:
-        elem_attrib = ''
-    return elem_attrib
-
-
-def get_elem_dic(elem, elem_path: str, attrib: str):
-    _elem_list = elem.findall(elem_path)
-
-    _ret_dic = {}
-    for _elem in _elem_list:
-        _key = _elem.attrib.get(attrib, '')
-        _text = ''.join(_elem.itertext()).strip()
-        _ret_dic[_key] = _text
-
-    return _ret_dic
-
-
-def get_elem_list(elem, elem_path: str):
-    _elem_list = elem.findall(elem_path)
-    _ret_list = [''.join(_elem.itertext()).strip() for _elem in _elem_list]
-    return _ret_list
-
-
-def get_authors_info(elem):
-    authors_path = 'MedlineCitation/Article/AuthorList/Author'
-    author_elem_list = elem.findall(authors_path)
-
-    ret_authors_info = []
-    for author_elem in author_elem_list:
-        dic = {
-            'lastname': get_elem_text(author_elem, 'LastName'),
-            'forename': get_elem_text(author_elem, 'ForeName'),
-            'initials': get_elem_text(author_elem, 'Initials'),
-            'collective':  get_elem_text(author_elem, 'CollectiveName'),
-            'affiliation': get_elem_text(author_elem, 'AffiliationInfo/Affiliation')
-        }
-        ret_authors_info.append(dic)
-    return ret_authors_info
-
+        values = [doc[key] for key in _hashed_fields(tuple(doc))]
+    for i, value in enumerate(values):
+        if type(value) is list and value and isinstance(value[0], (Record, dict)):
+            values[i] = [_content_values(item) for item in value]
+    return values
 
-def get_grant_info(elem):
-    grant_path = 'MedlineCitation/Article/GrantList/Grant'
-    grant_elem_list = elem.findall(grant_path)
 
-    ret_grant_info = []
-    for grant_elem in grant_elem_list:
-        dic = {
-            'grant_id': get_elem_text(grant_elem, 'GrantID'),
-            'agency': get_elem_text(grant_elem, 'Agency'),
-            'country': get_elem_text(grant_elem, 'Country')
-        }
-        ret_grant_info.append(dic)
-    return ret_grant_info
+def content_hash(doc):
+    """パースした内容のハッシュ（16進数の文字列）
 
+    フィールド名の順に並べた値（dictの値はキーを並べ替える）をJSONにしてからハッシュするので，
+    同じ内容なら要素の順番などによらず，dictでもschema.Recordでも同じ値になる．
+    同じPMIDとVersionで再配信された記事が前回と同じかどうかを，格納済みのドキュメントを読まずに判定するのに使う．
 
-def get_reference_info(elem):
-    reference_path = 'PubmedData/ReferenceList/Reference'
-    refer_elem_list = elem.findall(reference_path)
+    Args:
+        doc(dict): パースしたドキュメント（schema.Recordも可．dictには変換しない）
 
-    ret_refer_info = []
-    for refer_elem in refer_elem_list:
-        dic = {
-            'citation': get_elem_text(refer_elem, 'Citation'),
-            'article_ids': get_elem_dic(refer_elem, 'ArticleIdList/ArticleId', 'IdType')
-        }
-        ret_refer_info.append(dic)
-    return ret_refer_info
+    Returns:
+        digest(str): 128bitのBLAKE2bのハッシュ
+    """
+    data = ujson.dumps(_content_values(doc), ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
-def get_comments_corrections_info(elem):
-    cc_path = 'MedlineCitation/CommentsCorrectionsList/CommentsCorrections'
-    cc_elem_list = elem.findall(cc_path)
+def parse_entity(elem, base_xml, plan=ENTITY_PLAN):
+    parsed_dic = plan.apply(elem)
+    parsed_dic['base_xml'] = base_xml
+    parsed_dic['content_hash'] = content_hash(parsed_dic)
+    return parsed_dic
 
-    ret_cc_info = []
-    for cc_elem in cc_elem_list:
-        dic = {
-            'ref_source': get_elem_text(cc_elem, 'RefSource'),
-            'pmid': get_elem_text(cc_elem, 'PMID'),
-        }
-        ret_cc_info.append(dic)
-    return ret_cc_info
 
+def parse_record(elem, base_xml, plan=ENTITY_PLAN):
+    """parse_entityと同じ内容を，dictの代わりに__slots__のArticleレコードで返す
 
-def parse_entity(elem, base_xml):
-    article_path = 'MedlineCitation/Article/'
+    著者などの入れ子もAuthor/Grant/Reference/CommentsCorrectionのレコードになる．
+    to_dict()でparse_entityと同じdictになる．
+    planにentity_plan(fields)を渡すと，指定したフィールドだけを抽出する．
+    """
+    record = plan.apply_record(elem)
+    record.base_xml = base_xml
+    record.content_hash = content_hash(record)
+    return record
 
-    pmid = get_elem_text(elem, 'MedlineCitation/PMID')
-    version = int(get_elem_attrib(elem, 'MedlineCitation/PMID', 'Version'))
 
-    if collection.find_one({'_id': pmid,  'version': {'$gte': version}}):
-        # これより新しいVersionのArticleが既に存在するので，飛ばす
+def handle_element(elem, base_xml, sink, index=None, vocabulary=None, edges=None, plan=ENTITY_PLAN,
+                   article_filter=None):
+    if elem.tag == 'DeleteCitation':
+        # 削除されたPMIDはファイル順にsinkで削除する
+        for pmid_elem in elem.findall('PMID'):
+            if article_filter is None or article_filter.match_pmid(pmid_elem.text):
+                sink.delete(pmid_elem.text, base_xml)
         return
+    write_entity(elem, base_xml, sink, index, vocabulary, edges, plan, article_filter)
 
-    parsed_dic = {
-        '_id': pmid,
-        'version':  version,
-        'base_xml': base_xml,
-        'date_completed': get_elem_text(elem, 'MedlineCitation/DateCompleted/Year'),
-        'date_revised': get_elem_text(elem, 'MedlineCitation/DateRevised/Year'),
-        'title': get_elem_text(elem, article_path+'ArticleTitle'),
-        'authors': get_authors_info(elem),
-        'pubdate': get_elem_text(elem, article_path+'Journal/JournalIssue/PubDate/Year'),
-        'journal': get_elem_text(elem, article_path+'Journal/Title'),
-        'volume': get_elem_text(elem, article_path + 'Journal/JournalIssue/Volume'),
-        'issue': get_elem_text(elem, article_path + 'Journal/JournalIssue/Issue'),
-        'page': get_elem_text(elem, article_path + 'Pagination/MedlinePgn'),
-        'issn': get_elem_text(elem, article_path + 'Journal/ISSN'),
-        'issn_linking': get_elem_text(elem, 'MedlineCitation/MedlineJournalInfo/ISSNLinking'),
-        'iso_abbreviation': get_elem_text(elem, article_path + 'Journal/ISOAbbreviation'),
-        'medline_ta': get_elem_text(elem, 'MedlineCitation/MedlineJournalInfo/MedlineTA'),
-        'abstract': get_elem_list(elem, article_path+'Abstract/AbstractText'),
-        'other_abstract': get_elem_list(elem, 'MedlineCitation/OtherAbstract/AbstractText'),
-        'lang': get_elem_text(elem, article_path+'Language'),
-        'country': get_elem_text(elem, 'MedlineCitation/MedlineJournalInfo/Country'),
-        'nlm_unique_id': get_elem_text(elem, 'MedlineCitation/MedlineJournalInfo/NlmUniqueID'),
-        'other_id': get_elem_dic(elem, 'MedlineCitation/OtherID', 'Source'),
-        'publication_types': get_elem_dic(elem, 'MedlineCitation/Article/'
-                                                'PublicationTypeList/PublicationType', 'UI'),
-        'keywords': get_elem_list(elem, 'MedlineCitation/KeywordList/Keyword'),
-        'mesh_terms': get_elem_dic(elem, 'MedlineCitation/MeshHeadingList/'
-                                         'MeshHeading/DescriptorName', 'UI'),
-        'chemical_list': get_elem_dic(elem, 'MedlineCitation/ChemicalList/'
-                                            'Chemical/NameOfSubstance', 'UI'),
-        'grants': get_grant_info(elem),
-        'article_ids': get_elem_dic(elem, 'PubmedData/ArticleIdList/ArticleId', 'IdType'),
-        'references': get_reference_info(elem),
-        'number_of_reference': get_elem_text(elem, 'MedlineCitation/NumberOfReferences'),
-        'citation_subset': get_elem_text(elem, 'MedlineCitation/CitationSubset'),
-        'comments_corrections': get_comments_corrections_info(elem),
-        'publication_status': get_elem_text(elem, 'PubmedData/PublicationStatus'),
-    }
-
-    # MongoDBに格納，versionが上なら上書き（古いVersionのやつは上で既に飛ばしてる）
-    collection.replace_one({'_id': pmid}, parsed_dic, upsert=True)
-
-
-def parse_all():
-    # ログを読み込み
-    with open('log/parsed_files.log', mode='r') as f:
-        parsed_file_list = f.readlines()
-    parsed_file_list = [f.rstrip('\n') for f in parsed_file_list]
 
-    # loggerを作成
+def write_entity(elem, base_xml, sink, index=None, vocabulary=None, edges=None, plan=ENTITY_PLAN,
+                 article_filter=None):
+    if article_filter is not None and not article_filter.match(elem):
+        # 条件に合わない記事は，インデックスを引く前にもdictを作る前にも捨てる
+        return
+    if index is not None:
+        # 新しいVersionか，同じファイルの同じVersionが格納済みなら，dictを作る前に飛ばす
+        pmid_elem = elem.find('MedlineCitation/PMID')
+        if index.check(int(pmid_elem.text), int(pmid_elem.attrib['Version']), base_xml):
+            return
+    record = parse_record(elem, base_xml, plan)
+    if edges is not None:
+        # 参考文献，著者，コメント・訂正を辺のテーブルにも書き出す（そのためだけに抽出したフィールドは除かれる）
+        record = edges.collect(record)
+    if vocabulary is not None:
+        # MeSHと化学物質はUIだけを残し，名前は語彙に集める
+        vocabulary.collect(record)
+    # sinkに書き込み，versionが上なら上書き（古いVersionのやつはsink側で飛ばす）
+    sink.write(record)
+
+
+# ローカルファイルに書き出すSink
+FILE_SINKS = {
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def make_sink(sink_type, xml_path, logger=None, queue_size=0, vocabulary=False, fields=None, article_range=None,
+              **sink_options):
+    """1ファイル分の書き込み先を作成する
+
+    Args:
+        sink_type(str): 'mongo'，'jsonl'，'parquet'のいずれか
+        xml_path(str): パースする.xml.gzのパス．ローカルファイルの名前に使う
+        logger: バッチごとの件数を出力するlogger
+        queue_size(int): 1以上なら別スレッドで書き込み，パースとの間のキューの上限にする
+        vocabulary(bool): MeSHと化学物質をUIのリストで書き出すか（parquetの列の型が変わる）
+        fields(tuple): 指定したフィールドだけを書き出す（parquetの列もそれだけになる）
+        article_range(tuple): ファイルの一部の記事の範囲(start, end)だけを書き込む場合に指定する
+        **sink_options: Sinkのコンストラクタに渡す引数（out_dir，batch_sizeなど）
+
+    Returns:
+        sink(BaseSink): 書き込み先
+    """
+    if sink_type == 'mongo':
+        if fields is not None:
+            # 一部のフィールドだけのドキュメントで格納済みの記事を置き換えてしまうので
+            raise ValueError('fields can only be used with jsonl/parquet sinks')
+        sink = MongoSink(get_collection(), logger=logger, **sink_options)
+    else:
+        name = output_name(xml_path, article_range)
+        if sink_type == 'parquet':
+            schema = ENTITY_ID_SCHEMA if vocabulary else ENTITY_SCHEMA
+            projected = entity_plan(tuple(fields) if fields is not None else None).schema
+            schema = {name: field for name, field in schema.items() if name in projected}
+            sink_options = dict(sink_options, schema=schema)
+        sink = FILE_SINKS[sink_type](name=name, logger=logger, **sink_options)
+    if queue_size > 0:
+        sink = ThreadedSink(sink, queue_size=queue_size)
+    return sink
+
+
+def range_key(xml_path, article_range):
+    """ファイルの記事の範囲を1つのタスクとして表すキー（マニフェストにもこのキーで記録する）"""
+    start, end = article_range
+    return f'{xml_path}#{start}-{end}'
+
+
+def split_range_key(key):
+    """range_keyを(xml_path, (start, end))に戻す．範囲のないパスなら(xml_path, None)"""
+    xml_path, sep, article_range = key.rpartition('#')
+    if not sep:
+        return key, None
+    start, end = article_range.split('-')
+    return xml_path, (int(start), int(end))
+
+
+def output_name(xml_path, article_range=None):
+    """ローカルファイルに書き出すときの名前．範囲ごとに別のファイルにする"""
+    name = os.path.basename(xml_path).split('.')[0]
+    if article_range is None:
+        return name
+    return f'{name}-{article_range[0]:07d}'
+
+
+def is_subdir(path, parent):
+    """pathがparentと同じか，その中のディレクトリならTrue"""
+    path, parent = os.path.realpath(path), os.path.realpath(parent)
+    return os.path.commonpath([path, parent]) == parent
+
+
+def manifest_path(sink_type, sink_options):
+    # ローカルファイルに書き出す場合は，出力ディレクトリごとに進捗を記録する
+    # （'_'始まりのファイルはParquetのデータセットとして読むときに無視される）
+    if sink_type == 'mongo':
+        return 'log/manifest.jsonl'
+    return os.path.join(sink_options['out_dir'], '_manifest.jsonl')
+
+
+def legacy_parsed_files_log(sink_type, sink_options):
+    # 以前の完了ファイルのログ．マニフェストに取り込む
+    if sink_type == 'mongo':
+        return 'log/parsed_files.log'
+    return os.path.join(sink_options['out_dir'], '_parsed_files.log')
+
+
+def parse_file(xml_path, sink, index=None, progress=None, reader='gzip', metrics=None, guard=None,
+               vocabulary=None, edges=None, plan=ENTITY_PLAN, article_filter=None, indexer=None, article_range=None):
+    """1ファイルをパースしてsinkに書き込む
+
+    Args:
+        xml_path(str): パースする.xml.gzのパス
+        sink(BaseSink): 書き込み先
+        index(VersionIndex): 格納済みの記事を飛ばすためのインデックス
+        progress(FileProgress): 指定するとコミット済みの要素を読み飛ばし，バッチごとに進捗を記録する
+        reader(str): .gzの読み方（xml_input.open_xmlを参照）
+        metrics(FileMetrics): 指定するとステージごとの時間を計測する
+        guard(RssGuard): 指定するとRSSが上限を超えたときにsinkをflushする
+        vocabulary(Vocabulary): 指定するとMeSHと化学物質をUIのリストにし，UIと名前を集める
+        edges(EdgeWriter): 指定すると参考文献，著者，コメント・訂正を辺のテーブルに書き出す
+        plan(ExtractionPlan): 抽出プラン．entity_plan(fields)で一部のフィールドだけを抽出する
+        article_filter(ArticleFilter): 指定すると条件に合う記事だけを書き込む
+        indexer(ArticleIndexer): 指定するとreaderの代わりにこれで読み，シークポイントと記事の位置を記録する
+        article_range(tuple): 指定するとGzipIndexを使い，(start, end)の範囲の記事だけを読む
+    """
+    if metrics is not None:
+        metrics.instrument(sink, index)
+    handler = partial(handle_element, base_xml=xml_path, sink=sink, index=index, vocabulary=vocabulary,
+                      edges=edges, plan=plan, article_filter=article_filter)
+    if progress is not None:
+        handler = progress.wrap(handler, sink)
+        sink.on_flush = progress.on_flush
+    if guard is not None:
+        handler = guard.wrap(handler)
+    if indexer is not None:
+        # 読み飛ばす要素も含めて，全記事のPMIDを記録する
+        handler = indexer.wrap(handler)
+    if indexer is not None:
+        f = indexer.open()
+    elif article_range is not None:
+        gzip_index = GzipIndex.load(gzip_index_path(xml_path))
+        if metrics is not None:
+            metrics.bytes_in = gzip_index.compressed_bytes(xml_path, *article_range)
+        f = gzip_index.open_articles(xml_path, *article_range)
+    else:
+        f = open_xml(xml_path, reader)
+    with f:
+        if metrics is not None:
+            f = metrics.wrap_input(f)
+            handler = metrics.wrap_handler(handler)
+            metrics.start()
+        tree = etree.iterparse(f, events=('end',), tag=('PubmedArticle', 'DeleteCitation'))
+        fast_iter(tree, handler)
+    if metrics is not None:
+        metrics.loop_done()
+    sink.flush()
+    if metrics is not None:
+        metrics.stop()
+
+
+def parse_file_worker(key, sink_type='mongo', sink_options=None, index_path=None, reader='gzip',
+                      collect_metrics=False, profile=None, profile_mode='cprofile', max_rss_mb=None,
+                      vocabulary=False, edges_dir=None, fields=None, article_filter=None, index_articles=False):
+    """1ファイルをパースしてsinkに書き込む（ワーカープロセス用）
+
+    ワーカーごとに自分の書き込み先（MongoDB接続など）を持つ．
+    バッチごとのチェックポイントはワーカーが，ファイルの完了は親プロセスがマニフェストに記録する．
+
+    Args:
+        key(str): パースする.xml.gzのパス．記事の範囲だけをパースする場合はrange_keyのキー
+        sink_type(str): 書き込み先の種類（make_sinkを参照）
+        sink_options(dict): Sinkのコンストラクタに渡す引数
+        index_path(str): VersionIndexのパス．Noneならインデックスを使わない
+        reader(str): .gzの読み方（xml_input.open_xmlを参照）
+        collect_metrics(bool): ステージごとの時間を計測するか
+        profile(str): このパスのファイルのときだけプロファイルし，log/profile/に書き出す
+        profile_mode(str): 'cprofile'か'sample'（metrics.profileを参照）
+        max_rss_mb(int): 指定するとRSSがこれを超えたときにsinkをflushする
+        vocabulary(bool): MeSHと化学物質をUIのリストで書き出し，UIと名前の対応を返すか
+        edges_dir(str): 指定すると参考文献，著者，コメント・訂正の辺のテーブルをここに書き出す（edges.EdgeWriterを参照）
+        fields(tuple): 指定したフィールド（と_id，version）だけを抽出して書き出す
+        article_filter(ArticleFilter): 指定すると条件に合う記事だけを書き込む
+        index_articles(bool): シークポイントと記事の位置のインデックス（gzip_index.GzipIndex）を
+            .xml.gzの隣に保存するか（範囲のキーの場合は保存済みのものを使うので無視する）
+
+    Returns:
+        result(tuple): (key, 正常に完了したか, 件数, VersionIndexに追加する分, 計測結果, 語彙,
+            記事の位置のインデックスを保存したか)
+    """
+    xml_path, article_range = split_range_key(key)
+    sink_options = sink_options or {}
+    edge_fields = ()
+    if fields is not None:
+        fields = tuple(fields)
+        if edges_dir:
+            # 辺のテーブルを作るのに必要なフィールドも抽出し，指定されていなければ書き込む前に除く
+            edge_fields = tuple(field for field in EDGE_FIELDS if field not in fields)
+    plan = entity_plan(fields + edge_fields if fields is not None else None)
     progress_logger = make_logger(log_name='parser-log', filename='log/parser.log', mode='a')
-    parsed_file_logger = make_logger(log_name='parsed-file-log', filename='log/parsed_files.log',
-                                     mode='a', formatter='%(message)s')
-
-    xml_dirs = ['dataset/baseline/*.xml.gz', 'dataset/updates/*.xml.gz']
-    descs = ['Baseline', 'Updates']
-    for i, xml_dir in enumerate(xml_dirs):
-        for xml_path in tqdm(glob(xml_dir), desc=descs[i]):
-            if xml_path in parsed_file_list:
-                # 既にパースしたファイルは飛ばす
-                continue
-            try:
-                tree = etree.iterparse(gzip.GzipFile(xml_path),
-                                       events=('end',), tag='PubmedArticle')
-                fast_iter(tree, partial(parse_entity, base_xml=xml_path))
-                parsed_file_logger.debug(xml_path)
-                progress_logger.debug(f'Complete: {xml_path}')
-            except EOFError:
-                progress_logger.warning(f'Broken file: {xml_path}')
-
-
-def parse_select():
-    # ログを読み込み
-    with open('log/parsed_files.log', mode='r') as f:
-        parsed_file_list = f.readlines()
-    parsed_file_list = [f.rstrip('\n') for f in parsed_file_list]
+    sink = make_sink(sink_type, xml_path, logger=progress_logger, vocabulary=vocabulary, fields=fields,
+                     article_range=article_range, **sink_options)
+    # インデックスへの追記は親プロセスが行うので，ここでは読むだけ
+    index = VersionIndex(index_path) if index_path else None
+    progress = None
+    if sink.commits_on_flush:
+        # 語彙と辺のテーブルはファイル単位で書き出すので，それらを作る場合は途中から再開しない
+        progress = FileProgress(CheckpointManifest(manifest_path(sink_type, sink_options)), key,
+                                resume=not (vocabulary or edges_dir))
+        if progress.resumed:
+            progress_logger.debug(f'Resume: {key} (offset={progress.offset})')
+    metrics = FileMetrics(xml_path) if collect_metrics else None
+    vocab = Vocabulary([field for field in VOCABULARY_FIELDS if field in plan.schema]) if vocabulary else None
+    edges = (EdgeWriter(edges_dir, output_name(xml_path, article_range), drop_fields=edge_fields)
+             if edges_dir else None)
+    # processes=1では同じフィルタを続けて使うので，このファイルの分だけ数える
+    filtered_before = article_filter.filtered if article_filter is not None else 0
+    indexer = ArticleIndexer(xml_path) if index_articles and article_range is None else None
+    guard = RssGuard(max_rss_mb * 2 ** 20, sink, logger=progress_logger) if max_rss_mb else None
+    start = time.perf_counter()
+    try:
+        with sink:
+            if profile == xml_path:
+                name = output_name(xml_path, article_range)
+                suffix = 'prof' if profile_mode == 'cprofile' else 'folded'
+                with profile_block(f'log/profile/{name}.{suffix}', mode=profile_mode):
+                    parse_file(xml_path, sink, index, progress, reader, metrics, guard, vocab, edges, plan,
+                               article_filter, indexer, article_range)
+            else:
+                parse_file(xml_path, sink, index, progress, reader, metrics, guard, vocab, edges, plan,
+                           article_filter, indexer, article_range)
+    except EOFError:
+        return key, False, sink.counts, None, None, None, False
+    finally:
+        if edges is not None:
+            edges.close()
+    index_saved = False
+    if indexer is not None:
+        try:
+            indexer.save()
+            index_saved = True
+        except (ValueError, OSError) as e:
+            progress_logger.warning(f'Article index not saved: {e}')
+    counts = dict(sink.counts)
+    counts['seconds'] = round(time.perf_counter() - start, 1)
+    if index is not None:
+        counts['index_skipped'] = index.skipped
+    if article_filter is not None:
+        counts['filtered'] = article_filter.filtered - filtered_before
+    if edges is not None:
+        counts.update({f'{table}_edges': count for table, count in edges.counts.items()})
+    record = metrics.record(counts) if metrics is not None else None
+    if record is not None and article_range is not None:
+        record['file'] = key
+    return (key, True, counts, index.pending() if index is not None else None, record,
+            vocab.entries if vocab is not None else None, index_saved)
+
+
+def parse_files(xml_paths, processes=1, desc=None, sink_type='mongo', sink_options=None,
+                index_path=None, reader='gzip', stop_on_error=False, metrics_path=None, profile=None,
+                profile_mode='cprofile', max_rss_mb=None, vocabulary=False, edges_dir=None, fields=None,
+                article_filter=None, article_index_path=None, split_articles=None, metrics_exporter=None):
+    """ファイルをまとめてパースし，完了したファイルをマニフェストに記録する
+
+    processesが2以上ならファイル単位でプロセスプールに割り振る．
+    完了順は不定になるので，順序が意味を持つファイル（updates）はprocesses=1で渡すこと．
+    途中で止まったファイルは，マニフェストの最後のチェックポイントから再開する．
+
+    Args:
+        xml_paths(list): パースする.xml.gzのパスのリスト
+        processes(int): ワーカープロセス数
+        desc(str): tqdmの表示名
+        sink_type(str): 書き込み先の種類（make_sinkを参照）
+        sink_options(dict): Sinkのコンストラクタに渡す引数
+        index_path(str): VersionIndexのパス．指定すると格納済みの記事をDBに問い合わせずに飛ばす
+        reader(str): .gzの読み方（xml_input.open_xmlを参照）
+        stop_on_error(bool): 壊れたファイルがあればそこで止める（processes=1のときのみ有効）
+        metrics_path(str): 指定するとファイルごとのステージの時間などを{metrics_path}.jsonlに追記し，
+            合計を{metrics_path}.prom（Prometheusのテキスト形式）に書き出す
+        profile(str): このパスのファイルだけプロファイルする
+        profile_mode(str): 'cprofile'か'sample'
+        max_rss_mb(int): ワーカーのRSSの上限（MB）．超えたらsinkをflushする
+        vocabulary(bool): MeSHと化学物質をUIのリストで書き出し，UIと名前の対応を語彙のテーブルに保存する
+            （mongoなら{field}_vocabularyコレクション，それ以外は<out_dir>/_vocabulary/）
+        edges_dir(str): 指定すると参考文献，著者，コメント・訂正の辺のテーブルを<edges_dir>/{table}/に書き出す
+        fields(tuple): 指定したフィールド（と_id，version）だけを抽出して書き出す（jsonl/parquetのみ）．
+            それ以外のフィールドの部分木はたどらないので速い
+        article_filter(ArticleFilter): 指定すると条件（PMIDの集合，出版年，雑誌）に合う記事だけを書き込む
+        article_index_path(str): 指定するとファイルごとにシークポイントと記事の位置のインデックスを.xml.gzの隣に保存し，
+            ファイルごとのPMIDの範囲をここに記録する（get_articleで使う）
+        split_articles(int): 指定すると，インデックス（python -m script.gzip_indexで作成）のあるファイルを
+            この記事数ごとの範囲に分け，範囲ごとにワーカーに割り振る．1ファイルが大きいときに使う．
+            範囲の完了順は不定なので，DeleteCitationや同じ記事の重複を含むファイル（updates）には使わないこと
+        metrics_exporter(MetricsExporter): 複数回の呼び出しで合計を引き継ぐ場合に渡す（parse_allを参照）．
+            Noneならmetrics_pathから作る
+
+    Returns:
+        completed(list): 完了したファイルのパス（完了順）
+    """
+    sink_options = sink_options or {}
+    manifest = CheckpointManifest(manifest_path(sink_type, sink_options),
+                                  legacy_log=legacy_parsed_files_log(sink_type, sink_options))
+    # ワーカーが書き込む前に，ファイルごとの最後の状態だけに詰める
+    manifest.compact()
 
     # loggerを作成
     progress_logger = make_logger(log_name='parser-log', filename='log/parser.log', mode='a')
-    parsed_file_logger = make_logger(log_name='parsed-file-log', filename='log/parsed_files.log',
-                                     mode='a', formatter='%(message)s')
 
-    xml_files = ['dataset/baseline/pubmed19n0490.xml.gz', 'dataset/baseline/pubmed19n0482.xml.gz',
-                 'dataset/baseline/pubmed19n0370.xml.gz', 'dataset/updates/pubmed19n0974.xml.gz']
-    for xml_path in tqdm(xml_files):
-        if xml_path in parsed_file_list:
-            # 既にパースしたファイルは飛ばす
+    # 既にパースしたファイルは飛ばす
+    xml_paths = [xml_path for xml_path in xml_paths if not manifest.is_done(xml_path)]
+    # インデックスのあるファイルは記事の範囲に分け，範囲ごとのキーをタスクにする
+    tasks = []
+    ranges_left = {}
+    for xml_path in xml_paths:
+        ranges = article_ranges(xml_path, split_articles) if split_articles else None
+        if ranges is None or len(ranges) < 2:
+            tasks.append(xml_path)
             continue
-        try:
-            tree = etree.iterparse(gzip.GzipFile(xml_path),
-                                   events=('end',), tag='PubmedArticle')
-            fast_iter(tree, partial(parse_entity, base_xml=xml_path))
-            parsed_file_logger.debug(xml_path)
-            progress_logger.debug(f'Complete: {xml_path}')
-        except EOFError:
-            progress_logger.warning(f'Broken file: {xml_path}')
-
+        keys = [range_key(xml_path, article_range) for article_range in ranges]
+        ranges_left[xml_path] = {key for key in keys if not manifest.is_done(key)}
+        tasks.extend(key for key in keys if not manifest.is_done(key))
+    worker = partial(parse_file_worker, sink_type=sink_type, sink_options=sink_options,
+                     index_path=index_path, reader=reader,
+                     collect_metrics=metrics_path is not None or metrics_exporter is not None,
+                     profile=profile, profile_mode=profile_mode, max_rss_mb=max_rss_mb, vocabulary=vocabulary,
+                     edges_dir=edges_dir, fields=fields, article_filter=article_filter,
+                     index_articles=article_index_path is not None)
+    index = VersionIndex(index_path) if index_path else None
+    exporter = metrics_exporter
+    if exporter is None and metrics_path:
+        exporter = MetricsExporter(metrics_path)
+    locator = ArticleLocator(article_index_path) if article_index_path else None
+    vocabulary_store = None
+    if vocabulary:
+        vocabulary_store = (MongoVocabularyStore(get_collection().database) if sink_type == 'mongo'
+                            else FileVocabularyStore(sink_options['out_dir']))
+
+    completed_paths = []
+
+    def complete_file(xml_path, counts, index_saved):
+        # インデックスを保存できなかったファイルは登録しない（古いインデックスが残っていることもある）
+        if locator is not None and index_saved:
+            locator.add(xml_path)
+        manifest.done(xml_path, counts)
+        completed_paths.append(xml_path)
+        progress_logger.debug(f'Complete: {xml_path} (' +
+                              ', '.join(f'{key}={value}' for key, value in counts.items()) + ')')
+
+    # 前回すべての範囲が完了してからファイルの完了を記録する前に止まった分
+    for xml_path, keys in list(ranges_left.items()):
+        if not keys:
+            del ranges_left[xml_path]
+            complete_file(xml_path, range_counts(manifest, xml_path), True)
+
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        results = pool.imap_unordered(worker, tasks) if pool else map(worker, tasks)
+        for key, completed, counts, index_entries, record, vocabulary_entries, index_saved in tqdm(
+                results, total=len(tasks), desc=desc):
+            xml_path, article_range = split_range_key(key)
+            if completed:
+                if index is not None:
+                    index.add(xml_path, index_entries)
+                if vocabulary_store is not None:
+                    # マニフェストで完了にする前に保存する（途中で止まっても完了済みのファイルの語彙は残る）
+                    vocabulary_store.add(xml_path, vocabulary_entries)
+                if article_range is None:
+                    if exporter is not None:
+                        exporter.add(record)
+                    complete_file(xml_path, counts, index_saved)
+                    continue
+                manifest.done(key, counts)
+                ranges_left[xml_path].discard(key)
+                file_done = not ranges_left[xml_path]
+                if exporter is not None:
+                    exporter.add(record, file_done=file_done)
+                if file_done:
+                    del ranges_left[xml_path]
+                    # 範囲に分けたファイルは，インデックスが保存済みのもの
+                    complete_file(xml_path, range_counts(manifest, xml_path), True)
+            else:
+                progress_logger.warning(f'Broken file: {key}')
+                if stop_on_error and not pool:
+                    break
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if vocabulary_store is not None:
+            vocabulary_store.save()
+    return completed_paths
+
+
+def range_counts(manifest, xml_path):
+    """マニフェストに記録された，ファイルの範囲ごとの件数の合計"""
+    total = {}
+    for key, state in manifest.states.items():
+        if state['done'] and split_range_key(key)[0] == xml_path and key != xml_path:
+            for name, value in state.get('counts', {}).items():
+                total[name] = total.get(name, 0) + value
+    if 'seconds' in total:
+        total['seconds'] = round(total['seconds'], 1)
+    return total
+
+
+def get_article(pmid, article_index_path='log/article_index.json'):
+    """1記事だけを，ファイル全体を読まずに取り出してパースする
+
+    --article-indexを指定してパースしたファイルのインデックスから，記事を含むファイルと位置を引き，
+    直前のシークポイントから<PubmedArticle>要素の分だけを展開する．
+
+    Args:
+        pmid(int): PMID
+        article_index_path(str): parse_filesのarticle_index_path
+
+    Returns:
+        doc(dict): parse_entityと同じdict．見つからなければNone
+    """
+    data, xml_path = ArticleLocator(article_index_path).read_article(int(pmid))
+    if data is None:
+        return None
+    return parse_entity(etree.fromstring(data), xml_path)
+
+
+def shared_metrics_exporter(options):
+    # baselineとupdatesのように続けてparse_filesを呼ぶ場合に，.promの合計（カウンタ）を引き継ぐ
+    if options.get('metrics_path') and options.get('metrics_exporter') is None:
+        options = dict(options, metrics_exporter=MetricsExporter(options['metrics_path']))
+    return options
+
+
+def parse_all(processes=1, sink_type='mongo', sink_options=None, index_path=None, reader='gzip',
+              split_articles=None, **options):
+    options = shared_metrics_exporter(options)
+    # baselineはファイル間で順序がないので並列に処理する（記事の範囲に分けるのもbaselineだけ）
+    parse_files(sorted(glob('dataset/baseline/*.xml.gz')), processes=processes, desc='Baseline',
+                sink_type=sink_type, sink_options=sink_options, index_path=index_path,
+                reader=reader, split_articles=split_articles, **options)
+    # updatesはbaselineが全て終わってから，ファイル順に1つずつ適用する
+    parse_files(sorted(glob('dataset/updates/*.xml.gz')), processes=1, desc='Updates',
+                sink_type=sink_type, sink_options=sink_options, index_path=index_path,
+                reader=reader, **options)
+
+
+# updatesのファイル名（pubmed19n0974.xml.gzなど）の連番
+UPDATE_FILE_PATTERN = re.compile(r'^pubmed\d+n(\d+)\.xml\.gz$')
+
+
+def file_sequence(xml_path):
+    """ファイル名の連番．パターンに合わなければNone"""
+    match = UPDATE_FILE_PATTERN.match(os.path.basename(xml_path))
+    return int(match.group(1)) if match else None
+
+
+def last_applied_sequence(manifest, update_dir):
+    """update_dirのファイルのうち，完了済みの最大の連番．なければ0"""
+    update_dir = os.path.normpath(update_dir)
+    return max((file_sequence(path) or 0 for path, state in manifest.states.items()
+                if state['done'] and os.path.normpath(os.path.dirname(path)) == update_dir), default=0)
+
+
+def sync(update_dir='dataset/updates', sink_type='mongo', sink_options=None, index_path=None, reader='gzip',
+         **options):
+    """最後に適用したものより新しいupdatesのファイルだけを，連番の順に適用する
+
+    毎日追加されるupdatesを取り込むためのモード．baselineのディレクトリは見ない．
+    連番が飛んでいる（ダウンロードが抜けている）場合と，壊れたファイルがあった場合はそこで止め，
+    後ろのファイルを先に適用しないようにする．次回はそのファイルから再開する．
+
+    Args:
+        update_dir(str): updatesのディレクトリ
+        sink_type(str): 書き込み先の種類（make_sinkを参照）
+        sink_options(dict): Sinkのコンストラクタに渡す引数
+        index_path(str): VersionIndexのパス
+        reader(str): .gzの読み方（xml_input.open_xmlを参照）
+        **options: parse_filesに渡す引数（metrics_pathなど）
+
+    Returns:
+        completed(list): 適用したファイルのパス
+    """
+    sink_options = sink_options or {}
+    progress_logger = make_logger(log_name='parser-log', filename='log/parser.log', mode='a')
+    manifest = CheckpointManifest(manifest_path(sink_type, sink_options),
+                                  legacy_log=legacy_parsed_files_log(sink_type, sink_options))
+    last_sequence = last_applied_sequence(manifest, update_dir)
+
+    new_files = sorted((sequence, entry.path) for entry in os.scandir(update_dir)
+                       for sequence in [file_sequence(entry.name)]
+                       if sequence is not None and sequence > last_sequence)
+    xml_paths = []
+    # まだ1つも適用していなければ，最初のファイルの連番から始める
+    expected = last_sequence + 1 if last_sequence else None
+    for sequence, xml_path in new_files:
+        if expected is not None and sequence != expected:
+            progress_logger.warning(f'Sync: missing update files {expected:04d}-{sequence - 1:04d}, '
+                                    f'stopped before {xml_path}')
+            break
+        xml_paths.append(xml_path)
+        expected = sequence + 1
+
+    progress_logger.debug(f'Sync: last sequence={last_sequence}, new files={len(xml_paths)}')
+    completed = parse_files(xml_paths, processes=1, desc='Sync', sink_type=sink_type, sink_options=sink_options,
+                            index_path=index_path, reader=reader, stop_on_error=True, **options)
+    if completed:
+        progress_logger.debug(f'Sync: applied {len(completed)} files (last sequence={file_sequence(completed[-1])})')
+    return completed
+
+
+def parse_select(processes=1, sink_type='mongo', sink_options=None, index_path=None, reader='gzip',
+                 split_articles=None, **options):
+    options = shared_metrics_exporter(options)
+    xml_files = ['dataset/baseline/pubmed19n0490.xml.gz', 'dataset/baseline/pubmed19n0482.xml.gz',
+                 'dataset/baseline/pubmed19n0370.xml.gz']
+    update_files = ['dataset/updates/pubmed19n0974.xml.gz']
+    parse_files(xml_files, processes=processes, sink_type=sink_type, sink_options=sink_options,
+                index_path=index_path, reader=reader, split_articles=split_articles, **options)
+    parse_files(update_files, processes=1, sink_type=sink_type, sink_options=sink_options,
+                index_path=index_path, reader=reader, **options)
 
 
 def test():
@@ -241,12 +743,99 @@ def test():
 
 
 if __name__ == '__main__':
-    # parse_all()
-    parse_select()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', nargs='?', default='select', choices=['all', 'select', 'sync'],
+                        help='syncは前回より新しいupdatesのファイルだけを適用する')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='baselineをパースするワーカープロセス数')
+    parser.add_argument('--sink', default='mongo', choices=['mongo'] + list(FILE_SINKS),
+                        help='書き込み先．jsonl/parquetは--out-dirに書き出す')
+    parser.add_argument('--out-dir', default='dump', help='jsonl/parquetの出力ディレクトリ')
+    parser.add_argument('--partition-by', choices=['base_xml', 'year'],
+                        help='parquetをパーティションに分けて書き出す')
+    parser.add_argument('--version-index', help='PMIDごとの格納済みVersionのインデックスのパス'
+                                                '（log/version_indexなど）')
+    parser.add_argument('--reader', default='gzip', choices=READERS,
+                        help='.xml.gzの読み方（thread/pigzは展開をパースと並行に行う，'
+                             'mmapは展開済みの.xmlがあればそれを読む）')
+    parser.add_argument('--metrics', help='ファイルごとのステージの時間などを<path>.jsonlに追記し，'
+                                          '合計を<path>.promに書き出す（log/metricsなど）')
+    parser.add_argument('--profile', help='このファイルだけプロファイルしてlog/profile/に書き出す')
+    parser.add_argument('--profile-mode', default='cprofile', choices=['cprofile', 'sample'])
+    parser.add_argument('--max-rss-mb', type=int, help='ワーカーのRSSがこれを超えたら書き込みをflushする')
+    parser.add_argument('--vocabulary', action='store_true',
+                        help='MeSHと化学物質をUIのリストで書き出し，名前は語彙のテーブルに分けて保存する')
+    parser.add_argument('--edges-dir', help='参考文献（引用），著者，コメント・訂正の辺のテーブルをParquetで書き出す'
+                                            'ディレクトリ（dump_edgesなど．--out-dirの外に置く）')
+    parser.add_argument('--fields', help='抽出するフィールドをカンマ区切りで指定する（_idとversionは常に含む．'
+                                         'jsonl/parquetのみ）．例: mesh_terms,pubdate')
+    parser.add_argument('--pmid-file', help='このファイル（1行1PMID）に含まれる記事だけを書き込む')
+    parser.add_argument('--pubdate-from', type=int, help='この年以降に出版された記事だけを書き込む')
+    parser.add_argument('--pubdate-to', type=int, help='この年以前に出版された記事だけを書き込む')
+    parser.add_argument('--nlm-unique-ids', help='この雑誌（NlmUniqueIDのカンマ区切り）の記事だけを書き込む')
+    parser.add_argument('--article-index', help='ファイルごとにシークポイントと記事の位置のインデックスを保存し，'
+                                                'PMIDの範囲をこのJSONに記録する（log/article_index.jsonなど）')
+    parser.add_argument('--split-articles', type=int,
+                        help='インデックス（python -m script.gzip_index）のあるbaselineのファイルを，'
+                             'この記事数ごとの範囲に分けて並列にパースする')
+    parser.add_argument('--batch-size', type=int,
+                        help='1回に書き込む最大件数（指定しなければSinkの既定値．mongo/jsonlは1000，parquetは10000）')
+    parser.add_argument('--ordered', action='store_true', help='MongoDBのbulk_writeをorderedで実行')
+    parser.add_argument('--queue-size', type=int, default=0,
+                        help='1以上なら書き込みを別スレッドで行い，パースとの間のキューの上限にする')
+    args = parser.parse_args()
+    if args.edges_dir and args.sink != 'mongo' and is_subdir(args.edges_dir, args.out_dir):
+        # 記事のデータセットの中に別の列のParquetがあると，read_parquet(out_dir)で読めなくなる
+        parser.error('--edges-dir must not be inside --out-dir')
+
+    if args.sink == 'mongo':
+        sink_options = {'ordered': args.ordered}
+    else:
+        sink_options = {'out_dir': args.out_dir}
+    if args.batch_size is not None:
+        sink_options['batch_size'] = args.batch_size
+    sink_options['queue_size'] = args.queue_size
+    if args.sink == 'parquet':
+        sink_options['partition_by'] = args.partition_by
+
+    options = {'sink_type': args.sink, 'sink_options': sink_options, 'index_path': args.version_index,
+               'reader': args.reader, 'metrics_path': args.metrics, 'profile': args.profile,
+               'profile_mode': args.profile_mode, 'max_rss_mb': args.max_rss_mb,
+               'vocabulary': args.vocabulary, 'edges_dir': args.edges_dir,
+               'fields': tuple(args.fields.split(',')) if args.fields else None,
+               'article_index_path': args.article_index}
+    if args.pmid_file or args.pubdate_from or args.pubdate_to or args.nlm_unique_ids:
+        options['article_filter'] = ArticleFilter(
+            pmids=PmidSet.from_file(args.pmid_file) if args.pmid_file else None,
+            pubdate_from=args.pubdate_from, pubdate_to=args.pubdate_to,
+            nlm_unique_ids=args.nlm_unique_ids.split(',') if args.nlm_unique_ids else None)
+    if args.mode == 'sync':
+        sync(**options)
+    elif args.mode == 'all':
+        parse_all(processes=args.processes, split_articles=args.split_articles, **options)
+    else:
+        parse_select(processes=args.processes, split_articles=args.split_articles, **options)
     # test()
 
 
 """
 python -m script.pubmed_iter_parser
 で実行可能
+
+python -m script.pubmed_iter_parser all -p 8
+でbaselineを8プロセスで並列にパース
+
+python -m script.pubmed_iter_parser all -p 8 --sink jsonl --out-dir dump
+でMongoDBを使わずにgzip圧縮したJSON Linesに書き出す
+
+python -m script.pubmed_iter_parser sync
+で前回より新しいupdatesのファイルだけを順に適用する
+
+python -m script.pubmed_iter_parser all -p 8 --sink parquet --out-dir dump --edges-dir dump_edges
+python -m script.edges dump_edges -o dump_edges/citation_csr.npz
+で引用と著者の辺のテーブルも書き出し，引用グラフのCSRを作る
+
+python -m script.gzip_index dataset/baseline/*.xml.gz -p 8
+python -m script.pubmed_iter_parser all -p 8 --split-articles 5000
+でbaselineのインデックスを作り，1ファイルを5000記事ずつの範囲に分けて並列にパースする
 """
@@ -0,0 +1,388 @@
+class Field:
+    """出力ドキュメントの1フィールドの定義
+
+    Args:
+        path(str): 親要素からの相対パス（'/'区切りのタグ名）
+    """
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+    def build(self, matches):
+        """パスにマッチした要素（文書順）からフィールドの値を作る"""
+        raise NotImplementedError
+
+
+# フィールドごとのInternTableの既定の上限
+INTERN_SIZE = 50000
+
+
+class InternTable:
+    """同じ値の文字列を1つのオブジェクトにまとめる表（プロセスごと，上限つき）
+
+    雑誌名や国名，MeSHの名前などは何百万回も同じ値が出てくるが，lxmlからは毎回新しい文字列ができる．
+    初めて出てきた値を表に登録し，2回目以降は登録済みの文字列を返すことで，
+    バッチに溜めている間のメモリを減らす．表がmax_size件に達したら，それ以降の新しい値は登録しない．
+    値の種類が多いフィールドが他のフィールドの枠を使い切らないよう，表はフィールドごとに持つ．
+
+    Args:
+        max_size(int): 登録する値の最大数
+    """
+    __slots__ = ('max_size', '_table')
+
+    def __init__(self, max_size=INTERN_SIZE):
+        self.max_size = max_size
+        self._table = {}
+
+    def __call__(self, value):
+        interned = self._table.get(value)
+        if interned is not None:
+            return interned
+        if len(self._table) < self.max_size:
+            self._table[value] = value
+        return value
+
+    def __len__(self):
+        return len(self._table)
+
+    def clear(self):
+        self._table.clear()
+
+
+def _intern_table(intern):
+    """intern引数（boolまたは上限の件数）から表を作る．まとめないならNone"""
+    if not intern:
+        return None
+    return InternTable(INTERN_SIZE if intern is True else intern)
+
+
+class Text(Field):
+    """最初にマッチした要素のテキスト．なければ''
+
+    Args:
+        path(str): 親要素からの相対パス
+        intern(bool or int): 値をフィールドごとのInternTableでまとめるか（繰り返し出てくる値のフィールド用）．
+            intで表の上限を指定する
+    """
+    __slots__ = ('intern', 'table')
+
+    def __init__(self, path, intern=False):
+        super().__init__(path)
+        self.intern = bool(intern)
+        self.table = _intern_table(intern)
+
+    def build(self, matches):
+        if not matches:
+            return ''
+        value = ''.join(matches[0].itertext()).strip()
+        if self.table is not None:
+            value = self.table(value)
+        return value
+
+
+class Attrib(Field):
+    """最初にマッチした要素の属性値．なければ''
+
+    Args:
+        path(str): 親要素からの相対パス
+        attrib(str): 属性名
+        convert: 値を変換する関数（intなど）．Noneなら文字列のまま
+    """
+    __slots__ = ('attrib', 'convert')
+
+    def __init__(self, path, attrib, convert=None):
+        super().__init__(path)
+        self.attrib = attrib
+        self.convert = convert
+
+    def build(self, matches):
+        value = matches[0].attrib.get(self.attrib, '') if matches else ''
+        if self.convert is not None:
+            value = self.convert(value)
+        return value
+
+
+class TextList(Field):
+    """マッチした全要素のテキストのリスト
+
+    Args:
+        path(str): 親要素からの相対パス
+        intern(bool or int): 値をフィールドごとのInternTableでまとめるか．intで表の上限を指定する
+    """
+    __slots__ = ('intern', 'table')
+
+    def __init__(self, path, intern=False):
+        super().__init__(path)
+        self.intern = bool(intern)
+        self.table = _intern_table(intern)
+
+    def build(self, matches):
+        table = self.table
+        if table is not None:
+            return [table(''.join(elem.itertext()).strip()) for elem in matches]
+        return [''.join(elem.itertext()).strip() for elem in matches]
+
+
+class AttribList(Field):
+    """マッチした全要素の属性値のリスト（フィールドごとのInternTableでまとめる）
+
+    Args:
+        path(str): 親要素からの相対パス
+        attrib(str): 属性名
+        intern_size(int): InternTableの上限
+    """
+    __slots__ = ('attrib', 'table')
+
+    def __init__(self, path, attrib, intern_size=INTERN_SIZE):
+        super().__init__(path)
+        self.attrib = attrib
+        self.table = InternTable(intern_size)
+
+    def build(self, matches):
+        attrib, table = self.attrib, self.table
+        return [table(elem.attrib.get(attrib, '')) for elem in matches]
+
+
+class TextDict(Field):
+    """マッチした全要素の{属性値: テキスト}
+
+    キー（IdTypeやMeSHのUIなどの属性値）は常にフィールドごとのInternTableでまとめる．
+
+    Args:
+        path(str): 親要素からの相対パス
+        attrib(str): キーにする属性名
+        intern(bool or int): 値もInternTableでまとめるか．intで表の上限を指定する（キーの表も同じ上限）
+    """
+    __slots__ = ('attrib', 'intern', 'keys', 'table')
+
+    def __init__(self, path, attrib, intern=False):
+        super().__init__(path)
+        self.attrib = attrib
+        self.intern = bool(intern)
+        self.table = _intern_table(intern)
+        self.keys = InternTable(self.table.max_size if self.table is not None else INTERN_SIZE)
+
+    def build(self, matches):
+        attrib, keys, table = self.attrib, self.keys, self.table
+        if table is not None:
+            return {keys(elem.attrib.get(attrib, '')): table(''.join(elem.itertext()).strip())
+                    for elem in matches}
+        return {keys(elem.attrib.get(attrib, '')): ''.join(elem.itertext()).strip()
+                for elem in matches}
+
+
+class Records(Field):
+    """マッチした全要素をそれぞれサブスキーマで抽出したdictのリスト
+
+    Args:
+        path(str): 親要素からの相対パス
+        schema(dict): 各要素に適用するスキーマ
+        record_name(str): ExtractionPlan.apply_record()で作るレコードの型の名前
+    """
+    __slots__ = ('plan',)
+
+    def __init__(self, path, schema, record_name='Record'):
+        super().__init__(path)
+        self.plan = ExtractionPlan(schema, record_name)
+
+    def build(self, matches):
+        return [self.plan.apply(elem) for elem in matches]
+
+    def build_records(self, matches):
+        return [self.plan.apply_record(elem) for elem in matches]
+
+
+class Elem(Field):
+    """最初にマッチした要素そのもの．なければNone"""
+    __slots__ = ()
+
+    def build(self, matches):
+        return matches[0] if matches else None
+
+
+class Elems(Field):
+    """マッチした全要素のリスト"""
+    __slots__ = ()
+
+    def build(self, matches):
+        return list(matches)
+
+
+class Record:
+    """スキーマのフィールドを__slots__に持つレコードの基底クラス
+
+    フィールド名のキーを記事ごとに持つdictより小さく，作るのも速い．
+    doc['_id']やdoc.get()，dict(doc)のようにdictと同じように読めるので，sinkなどはそのまま扱える．
+    MongoDBやJSONに書き出すときはto_dict()（as_document()）で入れ子のレコードごとdictにする．
+    型はmake_record_type()でスキーマから作る．
+    """
+    __slots__ = ()
+    # 値がレコードのリストになるフィールド
+    _record_lists = ()
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __contains__(self, name):
+        return name in self.__slots__
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return as_document(self) == as_document(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{type(self).__name__}(' + ', '.join(f'{name}={getattr(self, name)!r}'
+                                                    for name in self.__slots__) + ')'
+
+    def to_dict(self):
+        """入れ子のレコードも含めてdictにする"""
+        dic = {name: getattr(self, name) for name in self.__slots__}
+        for name in self._record_lists:
+            if dic[name] is not None:
+                dic[name] = [record.to_dict() for record in dic[name]]
+        return dic
+
+
+def make_record_type(name, schema, extra_fields=()):
+    """スキーマのフィールド（とextra_fields）を__slots__に持つRecordのサブクラスを作る
+
+    Args:
+        name(str): 型の名前（'Article'など）
+        schema(dict): {フィールド名: Field}
+        extra_fields(tuple): スキーマの外で追加するフィールド名（'base_xml'など）
+
+    Returns:
+        record_type(type): Recordのサブクラス
+    """
+    slots = tuple(schema) + tuple(extra_fields)
+    namespace = {
+        '__slots__': slots,
+        '_record_lists': tuple(field_name for field_name, field in schema.items() if isinstance(field, Records)),
+    }
+    # dataclassesやnamedtupleと同じく，フィールドを直接代入する__init__を生成する（setattrのループより速い）
+    args = ', '.join(f'{slot}=None' for slot in slots)
+    body = '\n'.join(f'    self.{slot} = {slot}' for slot in slots)
+    exec(f'def __init__(self, {args}):\n{body}\n', {}, namespace)
+    return type(name, (Record,), namespace)
+
+
+def as_document(doc):
+    """レコードならdictにし，dictならそのまま返す（MongoDBやJSONに書き出す直前に使う）"""
+    if isinstance(doc, Record):
+        return doc.to_dict()
+    return doc
+
+
+class _Node:
+    __slots__ = ('children', 'leaves')
+
+    def __init__(self):
+        self.children = {}
+        self.leaves = []
+
+
+class ExtractionPlan:
+    """スキーマを一度だけコンパイルした抽出プラン
+
+    各フィールドのパスをタグ名のトライ木にまとめておき，
+    抽出時は木に含まれるタグの要素だけを1回ずつたどる．
+    共通のプレフィックス（'MedlineCitation/Article/Journal'など）は1回しか解決されず，
+    フィールドごとにルートからfind()し直すことがない．
+
+    apply()はdictを，apply_record()はスキーマから作った__slots__のレコード（record_type）を返す．
+
+    Args:
+        schema(dict): {フィールド名: Field}
+        record_name(str): apply_record()で作るレコードの型の名前
+        extra_fields(tuple): レコードにスキーマの外で追加するフィールド名（値はNoneで作る）
+    """
+
+    def __init__(self, schema, record_name='Record', extra_fields=()):
+        self.schema = schema
+        self.record_name = record_name
+        self.extra_fields = tuple(extra_fields)
+        self.record_type = make_record_type(record_name, schema, extra_fields)
+        self._record_builders = [(name, field.build_records if isinstance(field, Records) else field.build)
+                                 for name, field in schema.items()]
+        self._root = _Node()
+        for name, field in schema.items():
+            node = self._root
+            for tag in field.path.split('/'):
+                node = node.children.setdefault(tag, _Node())
+            node.leaves.append(name)
+
+    def project(self, fields):
+        """指定したフィールドだけを抽出するプランを作る
+
+        トライ木には指定したフィールドのパスしか入らないので，それ以外の部分木（参考文献や著者など）は
+        たどらずに飛ばす．フィールドの順は元のスキーマの順のまま．
+
+        Args:
+            fields(iterable): 残すフィールド名
+
+        Returns:
+            plan(ExtractionPlan): 同じrecord_nameとextra_fieldsを持つ新しいプラン
+        """
+        fields = set(fields)
+        unknown = fields - set(self.schema)
+        if unknown:
+            raise ValueError(f'Unknown fields: {sorted(unknown)}')
+        schema = {name: field for name, field in self.schema.items() if name in fields}
+        return ExtractionPlan(schema, self.record_name, self.extra_fields)
+
+    def _walk(self, node, elem, matches):
+        children = node.children
+        for child in elem:
+            child_node = children.get(child.tag)
+            if child_node is None:
+                continue
+            for name in child_node.leaves:
+                matches.setdefault(name, []).append(child)
+            if child_node.children:
+                self._walk(child_node, child, matches)
+
+    def apply(self, elem):
+        """要素にプランを適用して，スキーマの順にフィールドを抽出する
+
+        Args:
+            elem(Element): スキーマのパスの起点になる要素
+
+        Returns:
+            dic(dict): {フィールド名: 値}
+        """
+        matches = {}
+        self._walk(self._root, elem, matches)
+        return {name: field.build(matches.get(name, ())) for name, field in self.schema.items()}
+
+    def apply_record(self, elem):
+        """要素にプランを適用して，record_typeのレコードを作る
+
+        Args:
+            elem(Element): スキーマのパスの起点になる要素
+
+        Returns:
+            record(Record): スキーマの順にフィールドを持つレコード
+        """
+        matches = {}
+        self._walk(self._root, elem, matches)
+        return self.record_type(*[build(matches.get(name, ())) for name, build in self._record_builders])
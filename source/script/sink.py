@@ -0,0 +1,526 @@
+import gzip
+import os
+import queue
+import threading
+
+import ujson
+from pymongo import ReplaceOne, DeleteMany
+from pymongo.errors import BulkWriteError
+
+from script.schema import as_document
+
+
+# MongoDBの重複キーエラーのコード
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BaseSink:
+    """パースしたドキュメントの書き込み先の基底クラス
+
+    パースのループはwrite()でドキュメントを，delete()でDeleteCitationのPMIDを渡し，
+    ファイルの終わりでflush()を呼ぶ．countsには書き込み件数などを集計する．
+    mark()で渡した位置（処理済みの要素数など）は，flush()の結果に'position'として含める．
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.position = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, doc):
+        raise NotImplementedError
+
+    def delete(self, pmid, base_xml):
+        raise NotImplementedError
+
+    def mark(self, position):
+        """ここまでに渡したドキュメントの位置を記録する"""
+        self.position = position
+
+    def flush(self):
+        return {}
+
+    def close(self):
+        self.flush()
+
+
+class BufferedSink(BaseSink):
+    """ドキュメントをバッファに溜め，batch_sizeごとにまとめて書き込むSinkの基底クラス
+
+    同じバッチ内に同じPMIDが複数あれば，新しいVersionだけを残す．
+    同じVersionの場合は，content_hashが違えば後のものに置き換え，同じ（またはハッシュがない）なら後のものを飛ばす．
+    削除は書き込みとは別のバッチにし，間に挟まる書き込みを先にflushしてファイル順を保つ．
+    サブクラスはwrite_batch()とdelete_batch()を実装し，そのバッチの件数をdictで返す．
+    on_flushを設定すると，バッチを書き込むたびにそのバッチの件数を渡して呼び出す（チェックポイント用）．
+
+    Args:
+        batch_size(int): 1回に書き込む最大件数
+        logger: バッチごとの件数を出力するlogger．Noneなら出力しない
+    """
+    count_keys = ('written', 'skipped', 'deleted')
+    # flush()が返った時点で書き込みが確定するか（途中から再開できるか）
+    commits_on_flush = True
+
+    def __init__(self, batch_size=1000, logger=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.logger = logger
+
+        self.on_flush = None
+        self.batch_id = 0
+        self.counts = dict.fromkeys(self.count_keys, 0)
+        self._buffer = {}
+        self._buffer_skipped = 0
+        self._deletes = []
+
+    def write(self, doc):
+        """ドキュメントをバッファに追加し，batch_sizeに達したらflushする
+
+        Args:
+            doc(dict): '_id'と'version'を持つドキュメント（schema.Recordも可）
+        """
+        if self._deletes:
+            self.flush()
+        buffered = self._buffer.get(doc['_id'])
+        if buffered is not None and (buffered['version'] > doc['version'] or
+                                     (buffered['version'] == doc['version'] and
+                                      buffered.get('content_hash') == doc.get('content_hash'))):
+            # 同じバッチ内に新しいVersionか，同じ内容の同じVersionがあるので飛ばす
+            self._buffer_skipped += 1
+            return
+        self._buffer[doc['_id']] = doc
+
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def delete(self, pmid, base_xml):
+        """削除するPMIDをバッファに追加し，batch_sizeに達したらflushする
+
+        Args:
+            pmid(str): DeleteCitationのPMID
+            base_xml(str): DeleteCitationを含むファイル
+        """
+        if self._buffer or self._buffer_skipped:
+            self.flush()
+        self._deletes.append((pmid, base_xml))
+
+        if len(self._deletes) >= self.batch_size:
+            self.flush()
+
+    def write_batch(self, docs):
+        """バッファの中身を書き込む（サブクラスで実装）
+
+        Returns:
+            stats(dict): count_keysの各件数
+        """
+        raise NotImplementedError
+
+    def delete_batch(self, deletes):
+        """バッファの(PMID, base_xml)を削除する（サブクラスで実装）
+
+        Returns:
+            stats(dict): count_keysの各件数
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """バッファの中身を書き込む
+
+        Returns:
+            stats(dict): このバッチのbatch_idと件数
+        """
+        stats = dict.fromkeys(self.count_keys, 0)
+        stats['batch_id'] = self.batch_id
+        stats['position'] = self.position
+        if not self._buffer and not self._buffer_skipped and not self._deletes:
+            return stats
+
+        if self._deletes:
+            deletes = self._deletes
+            self._deletes = []
+            batch_stats = self.delete_batch(deletes)
+        else:
+            docs = list(self._buffer.values())
+            stats['skipped'] = self._buffer_skipped
+            self._buffer = {}
+            self._buffer_skipped = 0
+            batch_stats = self.write_batch(docs) if docs else {}
+        for key, value in batch_stats.items():
+            stats[key] += value
+
+        for key in self.count_keys:
+            self.counts[key] += stats[key]
+        if self.logger is not None:
+            self.logger.debug(f'Batch {stats["batch_id"]}: ' +
+                              ', '.join(f'{key}={stats[key]}' for key in self.count_keys))
+        if self.on_flush is not None:
+            self.on_flush(stats)
+        self.batch_id += 1
+        return stats
+
+
+class BufferedFileSink(BufferedSink):
+    """ローカルファイルへ書き出すSinkの基底クラス
+
+    ファイルをまたいだVersionの比較は行わないので，読み込む側で最大のversionを採用すること．
+    出力ファイルはclose()するまで完成しないので，途中から再開せずにファイルの最初から書き直す．
+
+    Args:
+        out_dir(str): 出力ディレクトリ
+        name(str): 出力ファイル名のプレフィックス（元のxmlファイル名など）
+        batch_size(int): 1回に書き出す最大件数
+        logger: バッチごとの件数を出力するlogger．Noneなら出力しない
+    """
+    commits_on_flush = False
+
+    def __init__(self, out_dir, name, batch_size=1000, logger=None):
+        super().__init__(batch_size=batch_size, logger=logger)
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.name = name
+
+
+class JsonlSink(BufferedFileSink):
+    """gzip圧縮したJSON Lines（1行1ドキュメント）に書き出すSink
+
+    shard_size件ごとに{name}-{連番}.jsonl.gzのファイルを切り替える．
+    削除は{"_id": PMID, "deleted": true, "base_xml": ...}の行（tombstone）としてファイル順に書き出す．
+
+    Args:
+        out_dir(str): 出力ディレクトリ
+        name(str): 出力ファイル名のプレフィックス
+        batch_size(int): 1回に書き出す最大件数
+        shard_size(int): 1ファイルあたりの最大件数
+        compresslevel(int): gzipの圧縮レベル
+        logger: バッチごとの件数を出力するlogger
+    """
+
+    def __init__(self, out_dir, name, batch_size=1000, shard_size=100000, compresslevel=6, logger=None):
+        super().__init__(out_dir, name, batch_size=batch_size, logger=logger)
+        self.shard_size = shard_size
+        self.compresslevel = compresslevel
+
+        self.shard_id = 0
+        self._shard_count = 0
+        self._file = None
+
+    def _open_shard(self):
+        path = os.path.join(self.out_dir, f'{self.name}-{self.shard_id:05d}.jsonl.gz')
+        self._file = gzip.open(path, mode='wb', compresslevel=self.compresslevel)
+        self._shard_count = 0
+        self.shard_id += 1
+
+    def write_batch(self, docs):
+        return {'written': self._write_lines(docs)}
+
+    def delete_batch(self, deletes):
+        return {'deleted': self._write_lines([{'_id': pmid, 'deleted': True, 'base_xml': base_xml}
+                                              for pmid, base_xml in deletes])}
+
+    def _write_lines(self, docs):
+        written = len(docs)
+        while docs:
+            if self._file is None or self._shard_count >= self.shard_size:
+                self._close_shard()
+                self._open_shard()
+            chunk = docs[:self.shard_size - self._shard_count]
+            docs = docs[len(chunk):]
+            lines = ''.join(ujson.dumps(as_document(doc), ensure_ascii=False) + '\n' for doc in chunk)
+            self._file.write(lines.encode('utf-8'))
+            self._shard_count += len(chunk)
+        return written
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        super().close()
+        self._close_shard()
+
+
+class ParquetSink(BufferedFileSink):
+    """Parquetに書き出すSink．パーティションごとにrow_group_size件溜まったらrow groupを書き出す
+
+    列の型は出力ドキュメントのスキーマから決める．authors，references，grantsなどは
+    structのリスト，mesh_terms，chemical_listなどはmapの列になる．
+    partition_byを指定すると{out_dir}/{列名}={値}/{name}.parquetに分けて書き出す
+    （列名はarrow_export.PARTITION_COLUMNS．'base_xml'ならbase_xml_name=pubmed19n0001のようにし，
+    読み込んだときにフルパスのbase_xml列が上書きされないようにする）．
+    バッチをそのままrow groupにすると，year=などで分けたときに数件のrow groupが大量にできて読み込みが遅くなるので，
+    パーティションごとにドキュメントを溜め，row_group_size件に達したときとclose()のときに書き出す．
+    メモリはパーティションの数×row_group_size件まで使う（1つのxmlファイル分を超えることはない）．
+    削除されたPMIDは{out_dir}/_deleted/{name}.parquet（_id，base_xmlの列）に書き出す．
+    pyarrowが必要．Mongoへの格納だけならインストールしなくてよい．
+
+    Args:
+        out_dir(str): 出力ディレクトリ
+        name(str): 出力ファイル名（{name}.parquet）
+        schema(dict): 出力ドキュメントのスキーマ（ENTITY_SCHEMAなど）
+        batch_size(int): 1回にSinkのバッファから取り出す最大件数
+        row_group_size(int): 1つのrow groupの件数の目安
+        partition_by(str): None，'base_xml'（元のファイル名），'year'（pubdateの年）のいずれか
+        compression(str): Parquetの圧縮方式
+        logger: バッチごとの件数を出力するlogger
+    """
+
+    def __init__(self, out_dir, name, schema, batch_size=10000, row_group_size=50000, partition_by=None,
+                 compression='snappy', logger=None):
+        try:
+            import pyarrow.parquet
+            from script.arrow_export import ArrowConverter, PARTITION_COLUMNS, partition_value
+        except ImportError:
+            raise ImportError('ParquetSink requires pyarrow: pip install pyarrow')
+        super().__init__(out_dir, name, batch_size=batch_size, logger=logger)
+        self._pq = pyarrow.parquet
+        self._partition_value = partition_value
+        self.converter = ArrowConverter(schema)
+        self.row_group_size = row_group_size
+        self.partition_by = partition_by
+        self._partition_column = PARTITION_COLUMNS[partition_by] if partition_by is not None else None
+        self.compression = compression
+        self._writers = {}
+        # パーティションごとのまだrow groupにしていないドキュメント
+        self._pending = {}
+        self._deleted_writer = None
+
+    def _writer(self, partition):
+        writer = self._writers.get(partition)
+        if writer is None:
+            if partition is None:
+                path = os.path.join(self.out_dir, f'{self.name}.parquet')
+            else:
+                part_dir = os.path.join(self.out_dir, f'{self._partition_column}={partition}')
+                os.makedirs(part_dir, exist_ok=True)
+                path = os.path.join(part_dir, f'{self.name}.parquet')
+            writer = self._pq.ParquetWriter(path, self.converter.schema, compression=self.compression)
+            self._writers[partition] = writer
+        return writer
+
+    def _write_row_group(self, partition):
+        docs = self._pending.pop(partition)
+        self._writer(partition).write_table(self.converter.to_table(docs), row_group_size=len(docs))
+
+    def write_batch(self, docs):
+        if self.partition_by is None:
+            partitions = {None: docs}
+        else:
+            partitions = {}
+            for doc in docs:
+                partitions.setdefault(self._partition_value(doc, self.partition_by), []).append(doc)
+        for partition, partition_docs in partitions.items():
+            pending = self._pending.setdefault(partition, [])
+            pending.extend(partition_docs)
+            if len(pending) >= self.row_group_size:
+                self._write_row_group(partition)
+        return {'written': len(docs)}
+
+    def delete_batch(self, deletes):
+        import pyarrow as pa
+
+        table = pa.table({'_id': [pmid for pmid, _ in deletes],
+                          'base_xml': [base_xml for _, base_xml in deletes]})
+        if self._deleted_writer is None:
+            deleted_dir = os.path.join(self.out_dir, '_deleted')
+            os.makedirs(deleted_dir, exist_ok=True)
+            self._deleted_writer = self._pq.ParquetWriter(os.path.join(deleted_dir, f'{self.name}.parquet'),
+                                                          table.schema, compression=self.compression)
+        self._deleted_writer.write_table(table)
+        return {'deleted': len(deletes)}
+
+    def close(self):
+        super().close()
+        for partition in list(self._pending):
+            self._write_row_group(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        if self._deleted_writer is not None:
+            self._deleted_writer.close()
+            self._deleted_writer = None
+
+
+class ThreadedSink(BaseSink):
+    """別スレッドで書き込むSinkのラッパー
+
+    write()/delete()は上限つきのキューに積むだけで返るので，
+    MongoDBへの書き込みの待ち時間とXMLのパースが並行に進む．
+    キューがqueue_size件で埋まるとパース側が待つので，メモリは増え続けない．
+    書き込みの順序はキューに積んだ順のまま保たれる．
+    進捗のmark()はキューに積まず，次に積む要素に添えて書き込みスレッドに渡すので，
+    queue_sizeはドキュメント（と削除）の件数だけの上限になる．
+
+    Args:
+        sink(BaseSink): 実際の書き込み先．書き込みスレッドからのみ呼び出す
+        queue_size(int): キューに積めるドキュメントの最大件数
+    """
+    _STOP = object()
+
+    def __init__(self, sink, queue_size=2000):
+        super().__init__()
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        # まだ書き込みスレッドに渡していない最後のmark()の位置
+        self._position = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def counts(self):
+        return self.sink.counts
+
+    @counts.setter
+    def counts(self, value):
+        # BaseSink.__init__からの代入は無視する（件数は書き込み先が持つ）
+        pass
+
+    @property
+    def commits_on_flush(self):
+        return getattr(self.sink, 'commits_on_flush', False)
+
+    @property
+    def on_flush(self):
+        return self.sink.on_flush
+
+    @on_flush.setter
+    def on_flush(self, callback):
+        # コールバックは書き込みスレッドから呼ばれる
+        self.sink.on_flush = callback
+
+    def _run(self):
+        while True:
+            method, args, done, position = self._queue.get()
+            if method is self._STOP:
+                return
+            result = None
+            if self._error is None:
+                try:
+                    # mark()はこの要素より前に呼ばれているので，先に渡す
+                    if position is not None:
+                        self.sink.mark(position)
+                    result = getattr(self.sink, method)(*args)
+                except BaseException as e:
+                    # 以降の要素は捨て，呼び出し側のスレッドで投げ直す
+                    self._error = e
+            if done is not None:
+                done.append(result)
+                done[0].set()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _take_position(self):
+        position, self._position = self._position, None
+        return position
+
+    def _put(self, method, *args):
+        self._raise_error()
+        self._queue.put((method, args, None, self._take_position()))
+
+    def write(self, doc):
+        self._put('write', doc)
+
+    def delete(self, pmid, base_xml):
+        self._put('delete', pmid, base_xml)
+
+    def mark(self, position):
+        self._position = position
+
+    def _call(self, method):
+        # 積んだ要素を全て処理し終えるまで待つ
+        done = [threading.Event()]
+        self._queue.put((method, (), done, self._take_position()))
+        done[0].wait()
+        self._raise_error()
+        return done[1]
+
+    def flush(self):
+        return self._call('flush')
+
+    def close(self):
+        try:
+            self._call('close')
+        finally:
+            self._queue.put((self._STOP, (), None, None))
+            self._thread.join()
+
+
+class MongoSink(BufferedSink):
+    """パースしたドキュメントをバッファに溜め，bulk_writeでまとめてMongoDBに書き込む
+
+    「最新のVersionのみ保持する」ルールはサーバー側の条件付きフィルタで判定する．
+    既に新しいVersionのドキュメントか，同じVersionでcontent_hashも同じドキュメントがある場合は
+    フィルタにマッチせず，upsertが重複キーエラーになるので，それをスキップとして数える．
+    ワーカー同士が同じPMIDを同時に挿入した場合も重複キーエラーになるので，その要求は一度だけ再送する．
+    同じVersionの再配信は内容が変わっているときだけ書き換わるので，updatesの書き込み量が減る．
+    content_hashのないドキュメントは従来どおりVersionだけで判定する．
+    DeleteCitationのPMIDはバッチごとにDeleteManyでまとめて削除する．
+
+    Args:
+        collection: 書き込み先のコレクション
+        batch_size(int): 1回のbulk_writeに含める最大件数
+        ordered(bool): bulk_writeをorderedで実行するか
+        logger: バッチごとの件数を出力するlogger．Noneなら出力しない
+    """
+    count_keys = ('upserted', 'replaced', 'skipped', 'deleted')
+
+    def __init__(self, collection, batch_size=1000, ordered=False, logger=None):
+        super().__init__(batch_size=batch_size, logger=logger)
+        self.collection = collection
+        self.ordered = ordered
+
+    def write_batch(self, docs):
+        stats = {'upserted': 0, 'replaced': 0, 'skipped': 0}
+        requests = [ReplaceOne(self.replace_filter(doc), as_document(doc), upsert=True) for doc in docs]
+        # 重複キーエラーは，他のワーカーが同じPMIDを同時に挿入した場合にも起きる．
+        # 先に挿入されたのが古いVersionなら再送で置き換わるので，一度だけ再送し，
+        # それでも重複キーエラーになったもの（格納済みの方が新しいか同じ内容）をスキップとして数える
+        duplicates = self._bulk_write(requests, stats)
+        if duplicates:
+            stats['skipped'] += len(self._bulk_write(duplicates, stats))
+        return stats
+
+    def _bulk_write(self, requests, stats):
+        """requestsを書き込み，件数をstatsに足す．重複キーエラーになった要求のリストを返す"""
+        duplicates = []
+        while requests:
+            try:
+                result = self.collection.bulk_write(requests, ordered=self.ordered)
+                stats['upserted'] += result.upserted_count
+                stats['replaced'] += result.matched_count
+                break
+            except BulkWriteError as e:
+                details = e.details
+                errors = details['writeErrors']
+                if any(err['code'] != DUPLICATE_KEY_ERROR for err in errors):
+                    raise
+                stats['upserted'] += details['nUpserted']
+                stats['replaced'] += details['nMatched']
+                duplicates.extend(requests[err['index']] for err in errors)
+                # orderedの場合はエラーの位置で止まるので，残りを再送する
+                requests = requests[errors[-1]['index'] + 1:] if self.ordered else []
+        return duplicates
+
+    @staticmethod
+    def replace_filter(doc):
+        """docで置き換えてよい格納済みドキュメントにマッチするフィルタ"""
+        content_hash = doc.get('content_hash')
+        if content_hash is None:
+            return {'_id': doc['_id'], 'version': {'$lt': doc['version']}}
+        # content_hashのない古いドキュメントは$neにマッチするので，一度だけ書き直される
+        return {'_id': doc['_id'], '$or': [{'version': {'$lt': doc['version']}},
+                                           {'version': doc['version'], 'content_hash': {'$ne': content_hash}}]}
+
+    def delete_batch(self, deletes):
+        result = self.collection.bulk_write([DeleteMany({'_id': {'$in': [pmid for pmid, _ in deletes]}})],
+                                            ordered=True)
+        return {'deleted': result.deleted_count}
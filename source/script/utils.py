@@ -9,15 +9,67 @@ import ujson
 from logging import getLogger, StreamHandler, FileHandler, Formatter, DEBUG
 
 
+def release_element(elem):
+    """処理済みの要素を解放する
+
+    要素の中身を消し，要素と祖先のそれぞれについて，先に出てきた兄弟要素を親から削除する．
+    iterparseのtagにマッチしない兄弟（DeleteCitationなど）やルート直下に溜まる要素も消えるので，
+    ファイルの大きさによらずメモリ上には処理中の要素の分しか残らない．
+
+    Args:
+        elem(Element): 処理済みの要素
+    """
+    elem.clear()
+    node = elem
+    parent = node.getparent()
+    while parent is not None:
+        while node.getprevious() is not None:
+            del parent[0]
+        node = parent
+        parent = node.getparent()
+
+
 def fast_iter(context, func):
     for event, elem in context:
         func(elem)
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
+        release_element(elem)
     del context
 
 
+def stringify_children(node):
+    """要素とその直下の子要素のテキストを連結する
+
+    Args:
+        node(Element): 対象の要素
+
+    Returns:
+        text(str): 連結したテキスト
+    """
+    parts = ([node.text] +
+             list(chain(*([c.text, c.tail] for c in node.getchildren()))) +
+             [node.tail])
+    return ''.join(filter(None, parts))
+
+
+def month_or_day_formater(month_or_day):
+    """月の略称（'Jan'など）または日を2桁の数字に変換する
+
+    Args:
+        month_or_day(str): 月の略称か日の数字
+
+    Returns:
+        numeric(str): 'MM'か'DD'形式の文字列．変換できない場合はNone．
+    """
+    if month_or_day.replace('.', '') in filter(None, calendar.month_abbr):
+        to_format = strptime(month_or_day.replace('.', ''), '%b').tm_mon
+    elif month_or_day.strip().isdigit() and '.' not in month_or_day:
+        to_format = int(month_or_day.strip())
+    else:
+        return None
+
+    return ('0' if to_format < 10 else '') + str(to_format)
+
+
 def write_to_json(filename, data):
     """データをインデントありのjson形式で保存
 
@@ -52,6 +104,9 @@ def make_logger(log_name, filename, mode='a',
     # set up logger
     logger = getLogger(log_name)
     logger.setLevel(DEBUG)
+    if logger.handlers:
+        # 同じプロセス内で作成済みなら，handlerを重複して追加しない
+        return logger
 
     # set up handler
     handler_format = Formatter(formatter)
@@ -0,0 +1,212 @@
+import os
+import shutil
+
+import numpy as np
+import ujson
+
+
+DELTA_DTYPE = np.dtype([('pmid', '<u4'), ('version', '<u2'), ('file_id', '<u2')])
+
+
+class VersionIndex:
+    """PMIDごとに格納済みの最新Versionと元ファイルを記録するディスク上のインデックス
+
+    PMIDでソートした配列をmmapで開き，二分探索で引く．
+    新しく格納した分は{path}.deltaに追記し，compact_sizeを超えたらソート済み配列にマージする．
+    ソート済み配列はマージのたびに世代ディレクトリ（{path}.gen{n}/pmid.npyなど）に書き出し，
+    シンボリックリンク{path}.currentを1回のos.replaceで切り替えるので，
+    読む側は必ず1つの世代の配列の組を開く．
+    MongoDBに問い合わせずに「新しいVersionか，同じファイルの同じVersionが格納済みか」を判定できる．
+
+    Args:
+        path(str): インデックスのファイルのプレフィックス（'log/version_index'など）
+        compact_size(int): deltaの件数がこれを超えたらマージする
+    """
+
+    def __init__(self, path, compact_size=1000000):
+        self.path = path
+        self.compact_size = compact_size
+        self.skipped = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        files_path = path + '.files.json'
+        if os.path.exists(files_path):
+            with open(files_path, mode='r') as f:
+                self.files = ujson.load(f)
+        else:
+            self.files = []
+        self._file_ids = {name: i for i, name in enumerate(self.files)}
+
+        self._load_generation()
+
+        delta = self._load_delta()
+        self._delta_pmid = np.ascontiguousarray(delta['pmid'])
+        self._delta_version = np.ascontiguousarray(delta['version'])
+        self._delta_file_id = np.ascontiguousarray(delta['file_id'])
+
+        # このプロセスで処理中のファイルの分（まだディスクには書いていない）
+        self._pending = {}
+
+    def _generation_dir(self):
+        """現在の世代のディレクトリ．リンクは1度だけ解決し，以降はその世代のファイルだけを開く"""
+        try:
+            return os.path.join(os.path.dirname(self.path), os.readlink(self.path + '.current'))
+        except FileNotFoundError:
+            return None
+
+    def _load_generation(self):
+        gen_dir = self._generation_dir()
+        if gen_dir is not None:
+            prefix = gen_dir + os.sep
+        elif os.path.exists(self.path + '.pmid.npy'):
+            # 世代ディレクトリを使う前の配置（{path}.pmid.npyなど）．次のマージで世代に移る
+            prefix = self.path + '.'
+        else:
+            prefix = None
+        if prefix is not None:
+            self._pmid = np.load(prefix + 'pmid.npy', mmap_mode='r')
+            self._version = np.load(prefix + 'version.npy', mmap_mode='r')
+            self._file_id = np.load(prefix + 'file_id.npy', mmap_mode='r')
+        else:
+            self._pmid = np.empty(0, dtype='<u4')
+            self._version = np.empty(0, dtype='<u2')
+            self._file_id = np.empty(0, dtype='<u2')
+
+    def _load_delta(self):
+        if not os.path.exists(self.path + '.delta'):
+            return np.empty(0, dtype=DELTA_DTYPE)
+        delta = np.fromfile(self.path + '.delta', dtype=DELTA_DTYPE)
+        # 同じPMIDは最後の要素が最大のVersionになるように並べる
+        return delta[np.lexsort((delta['version'], delta['pmid']))]
+
+    @staticmethod
+    def _search(pmids, pmid):
+        i = np.searchsorted(pmids, pmid, side='right') - 1
+        if i >= 0 and pmids[i] == pmid:
+            return i
+        return None
+
+    def lookup(self, pmid):
+        """格納済みの最新Versionと元ファイル
+
+        Args:
+            pmid(int): PMID
+
+        Returns:
+            (version, base_xml): 記録がなければ(0, None)
+        """
+        version, file_id = 0, None
+        i = self._search(self._pmid, pmid)
+        if i is not None:
+            version, file_id = int(self._version[i]), int(self._file_id[i])
+        i = self._search(self._delta_pmid, pmid)
+        if i is not None and self._delta_version[i] >= version:
+            version, file_id = int(self._delta_version[i]), int(self._delta_file_id[i])
+        return version, (self.files[file_id] if file_id is not None else None)
+
+    def is_current(self, pmid, version, base_xml=None):
+        """新しいVersionが格納済みか，同じVersionが同じファイルから格納済み（または処理中のファイルに既出）ならTrue
+
+        別のファイルから同じVersionが再配信された場合は内容が変わっているかもしれないので飛ばさず，
+        content_hashによる判定をsinkに任せる．同じファイルの再実行なら内容も同じなので飛ばす．
+
+        Args:
+            pmid(int): PMID
+            version(int): これから格納するVersion
+            base_xml(str): 記事を含むファイル．Noneなら同じVersionは飛ばさない
+        """
+        if self._pending.get(pmid, 0) >= version:
+            return True
+        stored_version, stored_xml = self.lookup(pmid)
+        if stored_version > version:
+            return True
+        return stored_version == version and base_xml is not None and stored_xml == base_xml
+
+    def check(self, pmid, version, base_xml=None):
+        """格納済みなら飛ばした件数に数えてTrueを返し，そうでなければ処理中として記録する
+
+        Args:
+            pmid(int): PMID
+            version(int): これから格納するVersion
+            base_xml(str): 記事を含むファイル（is_currentを参照）
+
+        Returns:
+            skip(bool): 記事を飛ばしてよいか
+        """
+        if self.is_current(pmid, version, base_xml):
+            self.skipped += 1
+            return True
+        self._pending[pmid] = version
+        return False
+
+    def pending(self):
+        """処理中のファイルで記録した(PMID, Version)の配列．親プロセスに返してadd()する"""
+        pmids = np.fromiter(self._pending.keys(), dtype='<u4', count=len(self._pending))
+        versions = np.fromiter(self._pending.values(), dtype='<u2', count=len(self._pending))
+        return pmids, versions
+
+    def _get_file_id(self, base_xml):
+        file_id = self._file_ids.get(base_xml)
+        if file_id is None:
+            file_id = len(self.files)
+            self.files.append(base_xml)
+            self._file_ids[base_xml] = file_id
+            with open(self.path + '.files.json', mode='w') as f:
+                ujson.dump(self.files, f)
+        return file_id
+
+    def add(self, base_xml, entries):
+        """格納が完了したファイルの分をdeltaに追記する
+
+        Args:
+            base_xml(str): 元のファイル
+            entries(tuple): pending()の戻り値
+        """
+        pmids, versions = entries
+        delta = np.empty(len(pmids), dtype=DELTA_DTYPE)
+        delta['pmid'] = pmids
+        delta['version'] = versions
+        delta['file_id'] = self._get_file_id(base_xml)
+        with open(self.path + '.delta', mode='ab') as f:
+            delta.tofile(f)
+
+        if os.path.getsize(self.path + '.delta') // DELTA_DTYPE.itemsize > self.compact_size:
+            self.compact()
+
+    def compact(self):
+        """deltaをソート済み配列にマージし，PMIDごとに最新Versionだけを残す"""
+        delta = self._load_delta()
+        pmid = np.concatenate([self._pmid, delta['pmid']])
+        version = np.concatenate([self._version, delta['version']])
+        file_id = np.concatenate([self._file_id, delta['file_id']])
+        order = np.lexsort((version, pmid))
+        pmid, version, file_id = pmid[order], version[order], file_id[order]
+        last = np.append(pmid[1:] != pmid[:-1], True)
+
+        # 新しい世代のディレクトリに書き出してから，リンクを1回で切り替える
+        old_dir = self._generation_dir()
+        generation = int(old_dir.rsplit('.gen', 1)[1]) + 1 if old_dir is not None else 0
+        name = f'{os.path.basename(self.path)}.gen{generation}'
+        gen_dir = os.path.join(os.path.dirname(self.path), name)
+        os.makedirs(gen_dir, exist_ok=True)
+        for array_name, arr in (('pmid', pmid[last]), ('version', version[last]), ('file_id', file_id[last])):
+            np.save(os.path.join(gen_dir, f'{array_name}.npy'), arr)
+        tmp_link = self.path + '.current.tmp'
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(name, tmp_link)
+        os.replace(tmp_link, self.path + '.current')
+        if os.path.exists(self.path + '.delta'):
+            os.remove(self.path + '.delta')
+        for array_name in ('pmid', 'version', 'file_id'):
+            if os.path.exists(f'{self.path}.{array_name}.npy'):
+                os.remove(f'{self.path}.{array_name}.npy')
+        # 1つ前の世代は，切り替え前にリンクを解決したワーカーが開くかもしれないので残し，その前を消す
+        if generation >= 2:
+            shutil.rmtree(os.path.join(os.path.dirname(self.path),
+                                       f'{os.path.basename(self.path)}.gen{generation - 2}'), ignore_errors=True)
+
+        self._load_generation()
+        empty = np.empty(0, dtype=DELTA_DTYPE)
+        self._delta_pmid, self._delta_version, self._delta_file_id = \
+            empty['pmid'].copy(), empty['version'].copy(), empty['file_id'].copy()
@@ -0,0 +1,118 @@
+import os
+
+import ujson
+from pymongo import UpdateOne
+
+
+# UIだけを残すフィールド（{UI: 名前}のTextDict）
+VOCABULARY_FIELDS = ('mesh_terms', 'chemical_list')
+
+
+class Vocabulary:
+    """記事の{UI: 名前}をUIのリストに置き換え，UIと名前の対応を集める（ワーカープロセス用）
+
+    Args:
+        fields(tuple): 置き換えるフィールド
+    """
+
+    def __init__(self, fields=VOCABULARY_FIELDS):
+        self.entries = {field: {} for field in fields}
+
+    def collect(self, doc):
+        """docのフィールドをUIのリストに置き換える
+
+        Args:
+            doc(dict): パースしたドキュメント（schema.Recordも可）
+        """
+        for field, entries in self.entries.items():
+            terms = doc[field]
+            entries.update(terms)
+            doc[field] = list(terms)
+
+
+class FileVocabularyStore:
+    """UIごとの名前と，最初/最後に出てきたファイルを{out_dir}/_vocabulary/{field}.jsonlに保存する
+
+    全体をメモリに持つ（MeSHと化学物質を合わせても数十万件程度）．
+    add()でファイル1つ分の変更をすぐに追記するので，マニフェストでファイルを完了にする前に呼べば，
+    途中で止まっても完了済みのファイルの語彙は失われない．読み込むときはUIごとに最後の行を採用し，
+    save()で1UI1行に書き直す．
+
+    Args:
+        out_dir(str): 出力ディレクトリ
+        fields(tuple): 語彙のフィールド
+    """
+
+    def __init__(self, out_dir, fields=VOCABULARY_FIELDS):
+        self.vocab_dir = os.path.join(out_dir, '_vocabulary')
+        os.makedirs(self.vocab_dir, exist_ok=True)
+        self.tables = {}
+        for field in fields:
+            table = {}
+            path = self._path(field)
+            if os.path.exists(path):
+                with open(path, mode='r') as f:
+                    for line in f:
+                        try:
+                            entry = ujson.loads(line)
+                        except ValueError:
+                            # 追記の途中で落ちた行は無視する
+                            continue
+                        table[entry['_id']] = entry
+            self.tables[field] = table
+
+    def _path(self, field):
+        return os.path.join(self.vocab_dir, f'{field}.jsonl')
+
+    def add(self, base_xml, entries):
+        """ファイル1つ分の{フィールド: {UI: 名前}}を追加し，変わった行を追記する．名前は後から出てきたもので上書きする"""
+        for field, terms in entries.items():
+            table = self.tables[field]
+            changed = []
+            for ui, name in terms.items():
+                entry = table.get(ui)
+                if entry is None:
+                    entry = table[ui] = {'_id': ui, 'name': name, 'first_seen': base_xml, 'last_seen': base_xml}
+                else:
+                    entry['name'] = name
+                    entry['last_seen'] = base_xml
+                changed.append(entry)
+            if changed:
+                with open(self._path(field), mode='a') as f:
+                    f.write(''.join(ujson.dumps(entry, ensure_ascii=False, escape_forward_slashes=False) + '\n'
+                                    for entry in changed))
+
+    def save(self):
+        for field, table in self.tables.items():
+            tmp_path = self._path(field) + '.tmp'
+            with open(tmp_path, mode='w') as f:
+                for ui in sorted(table):
+                    f.write(ujson.dumps(table[ui], ensure_ascii=False, escape_forward_slashes=False) + '\n')
+            os.replace(tmp_path, self._path(field))
+
+
+class MongoVocabularyStore:
+    """UIごとの名前と，最初/最後に出てきたファイルをMongoDBの{field}_vocabularyコレクションに保存する
+
+    Args:
+        database: 書き込み先のデータベース
+        batch_size(int): 1回のbulk_writeに含める最大件数
+    """
+
+    def __init__(self, database, batch_size=1000):
+        self.database = database
+        self.batch_size = batch_size
+
+    def add(self, base_xml, entries):
+        for field, terms in entries.items():
+            requests = [UpdateOne({'_id': ui},
+                                  {'$set': {'name': name, 'last_seen': base_xml},
+                                   '$setOnInsert': {'first_seen': base_xml}},
+                                  upsert=True)
+                        for ui, name in terms.items()]
+            collection = self.database[f'{field}_vocabulary']
+            for i in range(0, len(requests), self.batch_size):
+                collection.bulk_write(requests[i:i + self.batch_size], ordered=False)
+
+    def save(self):
+        pass
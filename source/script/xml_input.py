@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import io
+import mmap
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import zlib
+
+
+# 展開・読み込みのバッファサイズ（lxmlは小さい単位でread()するので，まとめて読んでおく）
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+READERS = ('gzip', 'zlib', 'thread', 'pigz', 'mmap')
+
+
+class ZlibReader(io.RawIOBase):
+    """.gzをzlibで直接展開して読むストリーム
+
+    gzip.GzipFileと違い，圧縮データをchunk_sizeずつまとめて読んで展開する．
+    連結されたgzip（複数メンバー）にも対応し，途中で切れていればEOFErrorを投げる．
+
+    Args:
+        path(str): .gzのパス
+        chunk_size(int): 1回に読む圧縮データのサイズ
+    """
+
+    def __init__(self, path, chunk_size=DEFAULT_BUFFER_SIZE):
+        super().__init__()
+        self._file = open(path, mode='rb')
+        self._chunk_size = chunk_size
+        self._decompressor = zlib.decompressobj(wbits=31)
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def inflate(self):
+        """次の展開済みデータ．終わりならb''"""
+        while True:
+            if self._decompressor.eof:
+                # 次のメンバー
+                data = self._decompressor.unused_data or self._file.read(self._chunk_size)
+                if not data:
+                    return b''
+                self._decompressor = zlib.decompressobj(wbits=31)
+            else:
+                data = self._file.read(self._chunk_size)
+                if not data:
+                    raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            out = self._decompressor.decompress(data)
+            if out:
+                return out
+
+    def readinto(self, b):
+        if not self._pending:
+            self._pending = memoryview(self.inflate())
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class ThreadedReader(io.RawIOBase):
+    """別スレッドで展開し，上限つきのキューを通して読むストリーム
+
+    zlibは展開中にGILを解放するので，lxmlのパースと展開が並行に進む．
+    キューがqueue_size個のチャンクで埋まると展開側が待つので，メモリは増え続けない．
+
+    Args:
+        source(ZlibReader): 展開元
+        queue_size(int): 先読みするチャンクの最大数
+    """
+
+    def __init__(self, source, queue_size=8):
+        super().__init__()
+        self._source = source
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # close()されたら待つのをやめる
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            while True:
+                chunk = self._source.inflate()
+                if not self._put(chunk) or not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._pending:
+            if self._done:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._done = True
+                raise item
+            if not item:
+                self._done = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._source.close()
+        super().close()
+
+
+class PipeReader(io.RawIOBase):
+    """外部コマンド（pigz -dcなど）の標準出力を読むストリーム
+
+    コマンドが異常終了した（ファイルが途中で切れていたなど）場合はEOFErrorを投げる．
+
+    Args:
+        args(list): 実行するコマンド
+        buffer_size(int): パイプのバッファサイズ
+    """
+
+    def __init__(self, args, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__()
+        self._process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         bufsize=buffer_size)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._process.stdout.readinto(b)
+        if not n and self._process.wait() != 0:
+            raise EOFError(f'{self._process.args[0]} exited with code {self._process.returncode}')
+        return n
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        self._process.wait()
+        super().close()
+
+
+def _decompress_command(path):
+    # pigzがなければgzipで展開する（どちらも別プロセスで動く）
+    command = shutil.which('pigz') or shutil.which('gzip')
+    if command is None:
+        raise FileNotFoundError('pigz or gzip command is required for the pigz reader')
+    return [command, '-dc', path]
+
+
+def _open_mmap(path):
+    with open(path, mode='rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def decompressed_path(path):
+    """展開済みの.xmlのパス（.xml.gzと同じディレクトリに置く）"""
+    return path[:-len('.gz')] if path.endswith('.gz') else path
+
+
+def open_xml(path, reader='gzip', buffer_size=DEFAULT_BUFFER_SIZE):
+    """XMLファイルを開く．.gzなら展開しながら読むファイルオブジェクトを返す
+
+    Args:
+        path(str): 開くファイルのパス
+        reader(str): .gzの読み方
+            'gzip': gzip.GzipFile
+            'zlib': zlibで大きな単位で展開
+            'thread': zlibの展開を別スレッドで行い，上限つきのキューで渡す
+            'pigz': pigz（なければgzip）コマンドで別プロセスで展開
+            'mmap': 展開済みの.xml（decompress()で作成）があればmmapで読み，なければ'zlib'
+        buffer_size(int): 読み込みのバッファサイズ
+
+    Returns:
+        f: バイナリモードのファイルオブジェクト
+    """
+    if reader not in READERS:
+        raise ValueError(f'Unknown reader: {reader}')
+    if reader == 'mmap':
+        xml_path = decompressed_path(path)
+        if os.path.exists(xml_path):
+            return _open_mmap(xml_path)
+        reader = 'zlib'
+    if not path.endswith('.gz'):
+        return open(path, mode='rb', buffering=buffer_size)
+
+    if reader == 'gzip':
+        return gzip.GzipFile(path)
+    if reader == 'zlib':
+        raw = ZlibReader(path, buffer_size)
+    elif reader == 'thread':
+        raw = ThreadedReader(ZlibReader(path, buffer_size))
+    else:
+        raw = PipeReader(_decompress_command(path), buffer_size)
+    return io.BufferedReader(raw, buffer_size)
+
+
+def decompress(path, overwrite=False):
+    """.xml.gzを同じディレクトリの.xmlに展開する（繰り返しパースする場合にreader='mmap'で使う）
+
+    Args:
+        path(str): .xml.gzのパス
+        overwrite(bool): 展開済みでも展開し直すか
+
+    Returns:
+        xml_path(str): 展開した.xmlのパス
+    """
+    xml_path = decompressed_path(path)
+    if xml_path == path or (os.path.exists(xml_path) and not overwrite):
+        return xml_path
+    tmp_path = xml_path + '.tmp'
+    with open_xml(path, reader='zlib') as src, open(tmp_path, mode='wb') as dst:
+        shutil.copyfileobj(src, dst, DEFAULT_BUFFER_SIZE)
+    os.replace(tmp_path, xml_path)
+    return xml_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='.xml.gzを展開して.xmlを作成する')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+    for xml_gz_path in args.paths:
+        print(decompress(xml_gz_path, overwrite=args.overwrite))